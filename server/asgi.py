@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings
+
+if settings.FACE_ENGINE_PREFORK:
+    from server_app import face_engine
+
+    face_engine.start()
@@ -0,0 +1,18 @@
+"""
+ASGI entry point for the live attendance feed.
+
+The API is served over WSGI (server.wsgi), this process only serves
+/api/attendance-view/<id>/live/ and is run with:
+
+    uvicorn server.live_asgi:application
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+
+django.setup()
+
+from server_app.feed import application
@@ -103,6 +103,18 @@ DATABASES = {
     }
 }
 
+# Attend claims and Idempotency-Key outcomes live in the default cache. It has
+# to be shared by every web process: the in-memory LocMem default only
+# coalesces retries that land on the same process. The database cache needs
+# `python manage.py createcachetable`, point it at Redis or Memcached instead
+# if one is available.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'server_cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -146,3 +158,94 @@ MEDIA_URL ='/uploads/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Login tokens are valid for SESSION_DAYS. Resolved tokens are cached per
+# process for SESSION_CACHE_TTL seconds, so a logout in another process is
+# honoured here within that time.
+SESSION_DAYS = 7
+# Logging in again past this many live sessions ends the oldest one.
+SESSION_MAX_PER_USER = 10
+SESSION_CACHE_SIZE = 4096
+SESSION_CACHE_TTL = 60
+
+# attend and student enrollment accept an Idempotency-Key header. The outcome
+# is kept in the shared default cache (see CACHES) for IDEMPOTENCY_TTL seconds
+# and replayed to retries on any process, a retry of a request still running
+# waits up to MAX_WAIT for it.
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 120
+IDEMPOTENCY_MAX_WAIT = 25
+
+# Export files are kept here, named after their ETag, and served again until
+# the course changes. Unset, every export is generated on request.
+EXPORT_CACHE_DIR = os.path.join(BASE_DIR, 'export_cache')
+EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+EXPORT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Face verification for attend submissions.
+# With ATTENDANCE_ASYNC (or ?async=1 on the request) attend answers 202 with a
+# job id and the face check runs on ATTENDANCE_JOB_WORKERS background threads.
+ATTENDANCE_ASYNC = False
+ATTENDANCE_JOB_WORKERS = 2
+ATTENDANCE_JOB_QUEUE_SIZE = 200
+ATTENDANCE_JOB_MAX_WAIT = 25
+# Length of the random codes students type in to attend a session.
+ATTENDANCE_CODE_LENGTH = 6
+# Geofence radius in metres for sessions created without one, 0 disables it.
+ATTENDANCE_DEFAULT_RADIUS = 100
+# A student's attend submission holds a claim on the session in the default
+# cache until it is stored or rejected, a retry meanwhile gets a 409.
+ATTENDANCE_CLAIM_TIMEOUT = 60
+# Most queued submissions accepted by one attendance-view/sync/ request.
+ATTENDANCE_SYNC_MAX_ITEMS = 50
+# Opening a session keeps its state and the course's enrollment encodings in
+# memory for attend. The open/commit flags are re-read every STATE_TTL seconds.
+ATTENDANCE_ROSTER_TTL = 15 * 60
+ATTENDANCE_ROSTER_STATE_TTL = 30
+# attendance-view/<id>/live/ streams a session's new entries over SSE or
+# WebSocket from its own ASGI process, server.live_asgi:application (the live
+# entry of the Procfile), while the API stays on WSGI. DatabaseBroker reads
+# the changes back every LIVE_POLL_INTERVAL seconds, LocalBroker only reaches
+# listeners in the process that stored the entry.
+LIVE_BROKER = "server_app.live.DatabaseBroker"
+LIVE_POLL_INTERVAL = 1
+LIVE_QUEUE_SIZE = 500
+LIVE_KEEPALIVE = 15
+
+# Face detection and encoding run in a pool of FACE_ENGINE_WORKERS processes
+# that load the dlib models once. 0 runs them inline in the web process.
+# Every web process starts its own pool, so by default the host's cores are
+# split between the WEB_CONCURRENCY web processes rather than each taking all.
+FACE_ENGINE_WORKERS = int(os.environ.get(
+    "FACE_ENGINE_WORKERS", max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", 1)))))
+FACE_ENGINE_TIMEOUT = 30
+FACE_ENGINE_PREFORK = True
+# Uploads are decoded (and JPEGs draft-decoded) down to this many pixels on the
+# longest side before detection.
+FACE_IMAGE_MAX_DIMENSION = 1024
+# Classroom photos keep more pixels so faces at the back are still detectable.
+FACE_GROUP_MAX_DIMENSION = 2400
+# Bulk enrollment reads, analyses and inserts this many archive images at a time.
+ENROLLMENT_CHUNK_SIZE = 32
+# Tolerance for 1:N matches against every enrolled face (attend?identify=1 and
+# the duplicate enrollment check), tighter than the 1:1 check.
+FACE_IDENTIFY_TOLERANCE = 0.38
+FACE_DUPLICATE_CHECK = True
+# Rejected attend uploads are dropped unless FACE_QUARANTINE_DIR is set, then
+# they are kept there for review, oldest evicted past FACE_QUARANTINE_MAX_BYTES.
+FACE_QUARANTINE_DIR = None
+FACE_QUARANTINE_MAX_BYTES = 500 * 1024 * 1024
+
+# Every face check logs the upload's original and processed size at INFO on
+# server_app.verification, the data for tuning FACE_IMAGE_MAX_DIMENSION.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'server_app': {'handlers': ['console'], 'level': 'WARNING'},
+        'server_app.verification': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
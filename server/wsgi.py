@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.FACE_ENGINE_PREFORK:
+    from server_app import face_engine
+
+    face_engine.start()
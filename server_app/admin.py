@@ -1,5 +1,5 @@
 from django.contrib import admin
-from server_app.models import Attendance, Course, Lecturer, Student, StudentAttendance, UserType, XSession
+from server_app.models import Attendance, AttendanceJob, Course, Lecturer, Student, StudentAttendance, UserType, XSession
 # Register your models here.
 
 admin.site.register(Lecturer)
@@ -9,3 +9,4 @@ admin.site.register(XSession)
 admin.site.register(Attendance)
 admin.site.register(Student)
 admin.site.register(StudentAttendance)
+admin.site.register(AttendanceJob)
@@ -3,7 +3,7 @@ from rest_framework.request import Request
 from django.http.request import HttpRequest as Request2
 from rest_framework import exceptions
 
-from server_app.models import Lecturer
+from server_app.verify import principal
 
 
 def lecturer_only(function):
@@ -22,14 +22,13 @@ def lecturer_only(function):
         if not request.user:
             raise exceptions.NotAuthenticated("Please login first")
         
-        try:
-            lecturer = Lecturer.objects.get(user = request.user)
+        resolved = principal(request)
+        if resolved is None or resolved.lecturer is None:
+            raise exceptions.AuthenticationFailed("Please login as a lecturer, to access this")
 
-            request.lecturer = lecturer
+        request.lecturer = resolved.lecturer
 
-            return function(*args, **kwargs)
-        except Lecturer.DoesNotExist:
-            raise exceptions.AuthenticationFailed("Please login as a lecturer, to access this")
+        return function(*args, **kwargs)
         
     return wrap
 
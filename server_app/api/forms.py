@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.forms import fields
 
 from server_app.models import Attendance, Course, Student
@@ -14,10 +15,17 @@ class CourseForm( forms.ModelForm):
         fields = ['title','code']
 
 class AttendanceForm (forms.ModelForm):
+    radius = forms.FloatField(min_value=0, required=False)
 
     class Meta:
         model = Attendance
-        fields = ['course', 'lat', 'long']
+        fields = ['course', 'lat', 'long', 'radius']
+
+    def clean_radius(self):
+        radius = self.cleaned_data.get('radius')
+        if radius is None:
+            return getattr(settings, "ATTENDANCE_DEFAULT_RADIUS", 100)
+        return radius
 
 class StudentForm( forms.ModelForm):
     class Meta:
@@ -2,7 +2,7 @@ from django.db.models import fields
 from rest_framework import serializers
 
 
-from server_app.models import Attendance, Course, Lecturer,StudentAttendance
+from server_app.models import Attendance, AttendanceJob, Course, Lecturer,StudentAttendance
 
 
 class LecturerSerializer(serializers.ModelSerializer):
@@ -21,7 +21,7 @@ class AttendanceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Attendance
-        fields = ['id','course','date','datetime','lat','long','code','is_open','commit','attendances','course_title','course_code']
+        fields = ['id','course','date','datetime','lat','long','radius','code','is_open','commit','attendances','committed_count','course_title','course_code']
 
 
 class StudentAttendanceSerializer(serializers.ModelSerializer):
@@ -33,9 +33,15 @@ class StudentAttendanceSerializer(serializers.ModelSerializer):
         'datetime',
         'lat'
         ,'long',
+        'distance',
         'commit',
         'matric_number',
         'attendance_image',
         'date']
 
-    
\ No newline at end of file
+
+class AttendanceJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = AttendanceJob
+        fields = ['id', 'attendance', 'status', 'message', 'created', 'finished', 'datetime']
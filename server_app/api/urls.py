@@ -19,7 +19,7 @@ from django.urls import path
 from django.urls.conf import include
 from rest_framework import routers
 
-from server_app.api.views import AttendanceViewSet, CourseViewSet, LecturerViewSet, StudentViewSet, login, user
+from server_app.api.views import AttendanceViewSet, CourseViewSet, LecturerViewSet, StudentViewSet, login, logout, user
 
 
 router = routers.DefaultRouter()
@@ -38,6 +38,7 @@ router.register(r'student-view',StudentViewSet)
 
 urlpatterns = [
     path('login', login, name='login'),
+    path('logout', logout, name='logout'),
     path('user', user, name='user'),
 
     
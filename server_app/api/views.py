@@ -1,25 +1,33 @@
 import datetime
-import os
+import json
+import zipfile
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.utils import timezone
 from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
 from server_app.api.decorators import lecturer_only
 from server_app.api.forms import AttendanceForm, CourseForm, LoginForm, StudentForm
-from server_app.api.serializers import AttendanceSerializer, CourseSerializer, StudentAttendanceSerializer
-from server_app.models import Attendance, Course, Student, StudentAttendance, UserType, XSession, random_id
+from server_app.api.serializers import AttendanceJobSerializer, AttendanceSerializer, CourseSerializer, StudentAttendanceSerializer
+from server_app.models import Attendance, AttendanceJob, Course, Student, StudentAttendance, UserType, XSession
 from rest_framework import viewsets
 from django.shortcuts import get_object_or_404
 from server_app.models import Lecturer
 from rest_framework import exceptions
-import face_recognition
-import openpyxl as excel
+from server_app import face_engine
+from server_app.verification import find_enrolled, identify_face, match_faces, verify_face
+from server_app import artifacts, codes, exports, jobs, live, marking, quarantine
+from server_app.enrollment import enroll_archive
+from server_app.geo import check_position, parse_position
+from server_app.idempotency import idempotent
+from server_app.sync import sync_submissions
+from server_app import roster as rosters
+from server_app.verify import principal, session_token, sessions, start_session
 from django.conf import settings
-from pathlib import Path
-
-TOLERANCE = 0.42
 
 
 @api_view(['post'])
@@ -49,13 +57,7 @@ def login(request):
 
         user_type = UserType.objects.get(user=user)
 
-        session_id = random_id(12)
-        session = XSession(user_type=user_type)
-
-        session.session = session_id
-        session.expires = datetime.datetime.now() + datetime.timedelta(days=7)
-
-        session.save()
+        session = start_session(user_type)
 
         return Response(
             {
@@ -83,19 +85,67 @@ def login(request):
     pass
 
 
+@api_view(['post'])
+def logout(request):
+    session_id = session_token(request)
+
+    # the post_delete signal drops it from the session cache
+    for session in XSession.objects.filter(session=session_id):
+        session.delete()
+    sessions.forget(session_id)
+
+    return Response(
+        {
+            "message": "Logged out"
+        }
+    )
+
+
 @api_view(['get'])
 def user(request):
-    user = request.user
-
-    user_type = UserType.objects.filter(user=user).first()
+    resolved = principal(request)
 
     return Response(
         {
-            'type': user_type.user_type
+            'type': resolved.role if resolved else None
         }
     )
 
 
+def is_flag(request, name, default=False):
+    value = request.query_params.get(name, request.data.get(name, None))
+    if value is None:
+        return default
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def export_format(request, default):
+    # not ?format=, DRF takes that one for content negotiation
+    return str(request.query_params.get("output", default)).lower()
+
+
+def unknown_export_format(*choices):
+    return Response(
+        status=status.HTTP_406_NOT_ACCEPTABLE,
+        data={
+            "message": f"output should be one of {', '.join(choices)}"
+        }
+    )
+
+
+def face_engine_unavailable():
+    return Response(
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        data={
+            "message": "Face verification is busy right now, please try again shortly"
+        }
+    )
+
+
+def is_async(request):
+    return is_flag(request, "async", getattr(settings, "ATTENDANCE_ASYNC", False))
+
+
 class LecturerViewSet(viewsets.ViewSet):
 
     queryset = Lecturer.objects.all()
@@ -134,13 +184,7 @@ class LecturerViewSet(viewsets.ViewSet):
             lecturer = Lecturer(email=email)
             lecturer.user = user
             lecturer.save()
-            session_id = random_id()
-
-            session = XSession()
-            session.user_type = user_type
-            session.session = session_id
-
-            session.save()
+            session = start_session(user_type)
 
             return Response(
                 {
@@ -153,30 +197,23 @@ class CourseViewSet(viewsets.ViewSet):
     queryset = Course.objects.all()
 
     def list(self, request):
-        user = request.user
-        try:
-            user_type = UserType.objects.get(user=user)
-            if user_type.user_type != "LECTURER":
-                raise exceptions.AuthenticationFailed(
-                    "Please login with a lecturer account")
-        except UserType.DoesNotExist:
+        resolved = principal(request)
+        if resolved is None or resolved.user_type is None:
             raise exceptions.AuthenticationFailed(
                 "Please login with a valid account")
+        if not resolved.is_lecturer():
+            raise exceptions.AuthenticationFailed(
+                "Please login with a lecturer account")
 
-        return Response(CourseSerializer(self.queryset.filter(lecturer=Lecturer.objects.get(user=user)), many=True).data)
+        return Response(CourseSerializer(self.queryset.listing().filter(lecturer=resolved.lecturer), many=True).data)
 
     def create(self, request):
-        user = request.user
-
-        try:
-            user_type = UserType.objects.get(user=user)
-        except UserType.DoesNotExist:
+        resolved = principal(request)
+        if resolved is None or resolved.user_type is None:
             raise exceptions.AuthenticationFailed(
                 "Please Login in with a lecturer account")
 
-        print(user_type.user_type)
-
-        if user_type.user_type != "LECTURER":
+        if resolved.role != "LECTURER":
             raise exceptions.AuthenticationFailed(
                 "2 Please Login in with a lecturer account")
 
@@ -189,9 +226,8 @@ class CourseViewSet(viewsets.ViewSet):
             )
         data = form.cleaned_data
 
-        try:
-            lecturer = Lecturer.objects.get(user=user)
-        except Lecturer.DoesNotExist:
+        lecturer = resolved.lecturer
+        if lecturer is None:
             raise exceptions.AuthenticationFailed(
                 "Please login with a valid lecturer account")
 
@@ -245,7 +281,7 @@ class AttendanceViewSet(viewsets.ViewSet):
                     "message": "You cant view courses attendances that are not yours"
                 }
             )
-        sets = self.queryset.filter(course=course)
+        sets = self.queryset.listing().filter(course=course)
 
         return Response(
             AttendanceSerializer(sets, many=True).data
@@ -262,16 +298,14 @@ class AttendanceViewSet(viewsets.ViewSet):
                 data=form.errors
             )
 
-        code = random_id(6)
-
         attendance = form.save(commit=False)
-        attendance.code = code
         attendance.is_open = True
         attendance.commit = False
         attendance.datetime = datetime.datetime.now()
 
         try:
-            attendance.save()
+            codes.save_with_code(attendance)
+            rosters.warm(attendance)
             return Response(
                 status=status.HTTP_201_CREATED,
                 data=AttendanceSerializer(attendance).data
@@ -297,7 +331,7 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
-        attendances = StudentAttendance.objects.filter(attendance=attendance)
+        attendances = StudentAttendance.objects.listing().filter(attendance=attendance)
 
         return Response(
             StudentAttendanceSerializer(attendances, many=True).data
@@ -319,6 +353,8 @@ class AttendanceViewSet(viewsets.ViewSet):
         attendance.commit = True
         attendance.is_open = False
         attendance.save()
+        rosters.invalidate(attendance.code)
+        live.publish_state(attendance)
 
         return Response(
             AttendanceSerializer(attendance).data
@@ -336,9 +372,12 @@ class AttendanceViewSet(viewsets.ViewSet):
                     "message": "Attendance not found"
                 }
             )
-        if not attendance.commit:
+        if not attendance.commit and attendance.is_open:
             attendance.is_open = False
+            attendance.closed_at = timezone.now()
             attendance.save()
+        rosters.invalidate(attendance.code)
+        live.publish_state(attendance)
 
         return Response(
             AttendanceSerializer(attendance).data
@@ -358,7 +397,10 @@ class AttendanceViewSet(viewsets.ViewSet):
             )
 
         attendance.is_open = True
+        attendance.closed_at = None
         attendance.save()
+        rosters.warm(attendance)
+        live.publish_state(attendance)
 
         return Response(
             AttendanceSerializer(attendance).data
@@ -377,7 +419,10 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
+        deleted = live.state_event(attendance, deleted=True)
         attendance.delete()
+        rosters.invalidate(attendance.code)
+        live.publish(deleted["id"], deleted)
 
         return Response(
             AttendanceSerializer(attendance).data
@@ -396,7 +441,7 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
-        attendances = self.queryset.filter(course=course)
+        attendances = self.queryset.listing().filter(course=course)
 
         return Response(
             AttendanceSerializer(attendances, many=True).data
@@ -415,7 +460,7 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
-        attendances = StudentAttendance.objects.filter(attendance=attendance)
+        attendances = StudentAttendance.objects.listing().filter(attendance=attendance)
 
         return Response(
             StudentAttendanceSerializer(attendances, many=True).data
@@ -424,7 +469,15 @@ class AttendanceViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     @lecturer_only
     def export_all(self, request, pk=None):
-        mark = int(request.query_params.get("mark",1))
+        try:
+            mark = float(request.query_params.get("mark", 1))
+        except ValueError:
+            return Response(
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={
+                    "message": "mark should be a number"
+                }
+            )
         try:
             course = Course.objects.get(pk=pk)
         except Course.DoesNotExist:
@@ -435,92 +488,139 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
-        course_attendances = self.queryset.filter(course=course)
-
-        students_attendances = StudentAttendance.objects.filter(
-            attendance__course=course)
+        output = export_format(request, "json")
+        if output != "json" and output not in exports.CONTENT_TYPES:
+            return unknown_export_format("json", "xlsx", "csv")
 
-        students = {}
-        index = 1
+        key = ("course", course.pk, course.version, output, mark)
+        if output != "json":
+            return artifacts.serve(
+                request, key, f"{course.code}-attendance-ALL", output,
+                lambda: exports.course_sheets(course, output, mark))
 
-        for student_attendance in students_attendances:
-            student = student_attendance.student
+        tag = artifacts.etag(key)
+        if artifacts.is_fresh(request, tag):
+            return artifacts.not_modified(tag)
+        matrix = exports.course_matrix(course)
+        return artifacts.with_etag(Response(exports.to_json(matrix, exports.scores(course, matrix, mark))), tag)
 
-            if (student.id) not in students:
-                students[(student.id)] = {
-                    "index": index + 1,
-                    "matric_number": student.matric_number,
-                    "attendances": 0
+    @action(detail=True, methods=['post'], permission_classes=[AllowAny])
+    @lecturer_only
+    def group_attend(self, request, pk=None):
+        try:
+            attendance = self.queryset.get(pk=pk)
+        except Attendance.DoesNotExist:
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data={
+                    "message": "Attendance not found"
                 }
-                index = index + 1
-
-        # workbook = excel.Workbook()
-        sheet = {}
-
-        sheet['A1'] = "Student Matric Number"
-        sheet['B1'] = "Date"
-
-        for (index, attendance) in enumerate(course_attendances):
-            
-
-            students_attendances = StudentAttendance.objects.filter(
-                attendance=attendance)
-           
-
-            sheet[f'{chr(ord("B")+index)}1'] = attendance.date().split(";")[0]
-
-            for student_attendance in students_attendances:
-                student_sheet = students[student_attendance.student.id]
-                
-                sheet[f'A{student_sheet["index"]}'] = student_sheet["matric_number"]
-                sheet[f'{chr(ord("B")+index)}{student_sheet["index"]}'] = 'Present'
-                student_sheet["attendances"] = int(student_sheet["attendances"])+1
-
-        sheet_two={}
-        #  workbook.create_sheet("Students Scores")
-        index = 2
-        sheet_two['A1'] = "Matric Number"
-        sheet_two['B1'] ="Presents"
-        sheet_two['C1'] = "Absent"
-        sheet_two['D1'] = "Total"
-        sheet_two['E1'] = "Mark"
-
-
-        for id in students:
-            student = students[id]
-            try:
-                sheet_two[f'A{index}'] =student['matric_number']
-            except Exception as error:
-                print(student)
-                print(error)
-            
-            sheet_two[f'B{index}'] =student['attendances']
-            sheet_two[f'C{index}'] = int(course_attendances.count()) - int(student['attendances'])
-            sheet_two[f'D{index}'] = int(course_attendances.count()) 
-            sheet_two[f'E{index}'] = float(int(student['attendances']) / int(course_attendances.count())) * mark
+            )
 
-            index = index +1
+        if attendance.commit:
+            return Response(
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                data={
+                    "message": "Attendance list already submitted"
+                }
+            )
 
-        # filename = f"{attendance.course.code}-{attendance.pk}-attendance-ALL.xlsx"
-        # path = Path.joinpath(settings.MEDIA_ROOT, "exports", filename)
-        # workbook.save(filename=path)
+        images = request.FILES.getlist("images") or request.FILES.getlist("image")
+        if not images:
+            return Response(
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={"message": "Please provide at least one classroom photo"}
+            )
 
-        # stt = (settings.MEDIA_URL+"exports/" + filename)
+        contents = [image.read() for image in images]
+        try:
+            analyses = face_engine.analyse_group(contents)
+        except OSError:
+            return Response(
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={"message": "Sorry one of the photos could not be read"}
+            )
+        except face_engine.EngineTimeout:
+            return face_engine_unavailable()
+
+        faces = [
+            (image_index, location)
+            for image_index, analysis in enumerate(analyses)
+            for location in analysis.locations
+        ]
+        encodings = [encoding for analysis in analyses for encoding in analysis.encoding]
+
+        # a student matched by several faces keeps the closest one
+        best = {}
+        unmatched = []
+        for face, (student_id, distance) in zip(faces, match_faces(encodings)):
+            if student_id is None:
+                unmatched.append(face)
+            elif student_id not in best or distance < best[student_id][0]:
+                if student_id in best:
+                    unmatched.append(best[student_id][1])
+                best[student_id] = (distance, face)
+            else:
+                unmatched.append(face)
+
+        present = set(StudentAttendance.objects.filter(
+            attendance=attendance, student_id__in=best).values_list('student_id', flat=True))
+        matric_numbers = dict(Student.objects.filter(
+            pk__in=best).values_list('pk', 'matric_number'))
+
+        image_field = StudentAttendance._meta.get_field('attendance_image')
+        saved_images = {}
+        now = timezone.now()
+        rows = []
+        marked = []
+        for student_id, (distance, (image_index, location)) in best.items():
+            if student_id in present or student_id not in matric_numbers:
+                continue
+
+            if image_index not in saved_images:
+                saved_images[image_index] = default_storage.save(
+                    image_field.generate_filename(None, images[image_index].name),
+                    ContentFile(contents[image_index]))
+
+            rows.append(StudentAttendance(
+                student_id=student_id,
+                attendance=attendance,
+                attendance_image=saved_images[image_index],
+                lat=attendance.lat,
+                long=attendance.long,
+                commit=True,
+                datetime=now
+            ))
+            marked.append({
+                "matric_number": matric_numbers[student_id],
+                "image": image_index,
+                "box": location,
+                "distance": round(distance, 4)
+            })
 
+        # a student marked by a concurrent attend keeps that entry
+        inserted = {row.student_id for row in marking.insert_many(rows)}
+        marked = [entry for entry, row in zip(marked, rows) if row.student_id in inserted]
+        if rows:
+            Course.touch(course_id=attendance.course_id)
 
         return Response(
             {
-                "attendance_sheet":sheet,
-                "score_sheet" : sheet_two
+                "faces": len(faces),
+                "marked": marked,
+                "already_present": [matric_numbers[student_id] for student_id in present if student_id in matric_numbers],
+                "unmatched": [
+                    {"image": image_index, "box": location} for image_index, location in unmatched
+                ]
             }
         )
 
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
     @lecturer_only
     def course_attendance(self, request, pk = None):
-        course = get_object_or_404(Course.objects.all(), pk)
+        course = get_object_or_404(Course.objects.all(), pk=pk)
 
-        attendances = StudentAttendance.objects.filter(attendance__course = course)
+        attendances = StudentAttendance.objects.listing().filter(attendance__course = course)
 
         return Response(StudentAttendanceSerializer(attendances, many=True).data)
 
@@ -528,7 +628,7 @@ class AttendanceViewSet(viewsets.ViewSet):
     @lecturer_only
     def export(self, request, pk=None):
         try:
-            attendance = self.queryset.get(pk=pk)
+            attendance = self.queryset.select_related('course').get(pk=pk)
         except Attendance.DoesNotExist:
             return Response(
                 status=status.HTTP_404_NOT_FOUND,
@@ -537,30 +637,16 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
-        attendances = StudentAttendance.objects.filter(attendance=attendance)
+        output = export_format(request, "xlsx")
+        if output not in exports.CONTENT_TYPES:
+            return unknown_export_format("xlsx", "csv")
 
-        workbook = excel.Workbook()
-
-        sheet = workbook.active
-
-        sheet['A1'] = "Student Matric Number"
-
-        for (index, item) in enumerate(attendances):
-            sheet[f'A{index+2}'] = item.student.matric_number
-
-        filename = f"attendance.xlsx"
-        path = os.path.join(settings.MEDIA_ROOT, filename)
-        # path = Path.joinpath(settings.MEDIA_ROOT, "exports", filename)
-        print(path)
-        file = open(path,'w');
-        file.close()
-        workbook.save(filename=path)
-
-        stt = (settings.MEDIA_URL+"/" + filename)
-        return Response(
-            {
-                "url": stt
-            }
+        return artifacts.serve(
+            request,
+            ("session", attendance.pk, attendance.course.version, output),
+            f"{attendance.course.code}-{attendance.pk}-attendance",
+            output,
+            lambda: exports.session_sheets(attendance)
         )
 
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
@@ -568,40 +654,45 @@ class AttendanceViewSet(viewsets.ViewSet):
         code = request.data.get("attendance_code", None)
         matric_number = request.data.get("matric_number", None)
 
-        try:
-            attendance = Attendance.objects.get(code__iexact=code)
+        attendance = Attendance.objects.by_code(code).first()
 
-            if not attendance.is_open:
-                return Response(
-                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
-                    data={
-                        "message": "Attendance list found but is not open"
-                    }
-                )
-            elif attendance.commit:
-                return Response(
-                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
-                    data={
-                        "message": "Attendance list already submitted"
-                    }
-                )
-        except Attendance.DoesNotExist:
+        if attendance is None:
             return Response(
                 status=status.HTTP_404_NOT_FOUND,
                 data={
                     "message": "No open attendance found, make sure the attendance code is correct"
                 }
             )
+        elif not attendance.is_open:
+            return Response(
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                data={
+                    "message": "Attendance list found but is not open"
+                }
+            )
+        elif attendance.commit:
+            return Response(
+                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                data={
+                    "message": "Attendance list already submitted"
+                }
+            )
 
         try:
             student = Student.objects.get(matric_number=matric_number)
 
+            # the attend that follows can then skip the student lookup
+            roster = rosters.get(code)
+            if roster is not None:
+                roster.add(student.pk, student.matric_number, student.encoding)
+
             return Response(
                 {
                     "course": CourseSerializer(attendance.course).data,
                     "date": attendance.datetime,
                     'lat': attendance.lat,
-                    'long': attendance.long
+                    'long': attendance.long,
+                    'radius': attendance.radius
                 }
             )
         except Student.DoesNotExist:
@@ -613,6 +704,7 @@ class AttendanceViewSet(viewsets.ViewSet):
             )
 
     @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @idempotent("attend")
     def attend(self, request):
         code = request.data.get("attendance_code", None)
 
@@ -622,34 +714,23 @@ class AttendanceViewSet(viewsets.ViewSet):
                 data={"message": "Please provide the course Attendance code"}
             )
 
+        # with identify the student is found from the face instead of the matric number
+        identify = is_flag(request, "identify")
+
         matric_number = request.data.get("matric_number", None)
-        if not matric_number:
+        if not matric_number and not identify:
             return Response(
                 status=status.HTTP_406_NOT_ACCEPTABLE,
                 data={"message": "Please provide your matric number"}
             )
-        distance = request.data.get("distance", None)
-        if not distance:
-            return Response(
-                status=status.HTTP_406_NOT_ACCEPTABLE,
-                data={"message": "Sorry could not determine your position, please make sure that GPS is enabled and permission granted to the app"}
-
-            )
-
-        lat = request.data.get("lat", None)
-        if not lat:
+        # the distance is worked out here from lat/long, the client's own value is not trusted
+        position = parse_position(request.data.get("lat", None), request.data.get("long", None))
+        if not position:
             return Response(
                 status=status.HTTP_406_NOT_ACCEPTABLE,
                 data={"message": "Sorry could not determine your position, please make sure that GPS is enabled and permission granted to the app"}
             )
-
-        long = request.data.get("long", None)
-        if not long:
-            return Response(
-                status=status.HTTP_406_NOT_ACCEPTABLE,
-                data={"message": "Sorry could not determine your position, please make sure that GPS is enabled and permission granted to the app"}
-
-            )
+        lat, long = position
 
         image = request.FILES.get("image")
         if not image:
@@ -658,7 +739,13 @@ class AttendanceViewSet(viewsets.ViewSet):
                 data={"message": "Please Capture an image showing your face"}
             )
 
-        attendance = self.queryset.filter(code__iexact=code).first()
+        roster = rosters.get(code)
+        if roster is not None:
+            attendance = roster.attendance()
+        else:
+            attendance = self.queryset.by_code(code).first()
+            if attendance:
+                roster = rosters.warm(attendance)
 
         if not attendance:
             return Response(
@@ -682,98 +769,199 @@ class AttendanceViewSet(viewsets.ViewSet):
                 }
             )
 
-        student = Student.objects.filter(matric_number=matric_number).first()
-        if not student:
+        # every check up to here is cheap, out of range submissions never get
+        # as far as decoding the image
+        distance, message = check_position(attendance, lat, long)
+        if message:
             return Response(
-                status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                status=status.HTTP_406_NOT_ACCEPTABLE,
                 data={
-                    "message": "This student is not enrolled yet"
+                    "message": message
                 }
             )
 
-        try:
-            student_attendance = StudentAttendance.objects.get(
-                student=student, attendance=attendance)
-
-            return Response(
-                status=status.HTTP_405_METHOD_NOT_ALLOWED,
-                data={
-                    "message": "This student is already on the list"
-                }
-            )
-        except StudentAttendance.DoesNotExist:
-            pass
+        if identify:
+            data = image.read()
+            try:
+                student, message = identify_face(data)
+            except face_engine.EngineTimeout:
+                return face_engine_unavailable()
 
-        student_attendance = StudentAttendance()
-        student_attendance.student = student
-        student_attendance.attendance = attendance
-        student_attendance.attendance_image = image
-        student_attendance.lat = lat
-        student_attendance.long = long
+            if message:
+                quarantine.store(data, image.name, matric_number or "unknown", message)
 
-        student_attendance.save()
+                return Response(
+                    status=status.HTTP_406_NOT_ACCEPTABLE,
+                    data={
+                        "message": message
+                    }
+                )
+        else:
+            student = roster.student(matric_number) if roster else None
+            if student is None:
+                student = Student.objects.filter(matric_number=matric_number).first()
+                if student and roster:
+                    roster.add(student.pk, student.matric_number, student.encoding)
 
-        attendance_image = face_recognition.load_image_file(
-            student_attendance.attendance_image.path)
-        face_location_list = face_recognition.face_locations(attendance_image)
+            if not student:
+                return Response(
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                    data={
+                        "message": "This student is not enrolled yet"
+                    }
+                )
 
-        if len(face_location_list) > 1:
-            student_attendance.delete()
+        if not marking.claim(student.pk, attendance.pk):
+            # a retry while the first submission is still being verified
             return Response(
-                status=status.HTTP_406_NOT_ACCEPTABLE,
-                data={
-                    "message": f"Sorry {len(face_location_list)} faces were detected, only one face should be in the image"
-                }
-            )
-        if len(face_location_list) < 1:
-            student_attendance.delete()
-            return Response(
-                status=status.HTTP_406_NOT_ACCEPTABLE,
+                status=status.HTTP_409_CONFLICT,
                 data={
-                    "message": f"Sorry no face was detected, make sure your face is showing in the image"
+                    "message": "Your attendance is already being processed, please wait"
                 }
             )
 
-        image_of_student = face_recognition.load_image_file(student.image.path)
-        student_face_encoding = face_recognition.face_encodings(image_of_student)[
-            0]
-
-        image_of_attendance = face_recognition.load_image_file(
-            student_attendance.attendance_image.path)
-        attendance_face_encoding = face_recognition.face_encodings(image_of_attendance)[
-            0]
-
-        result = face_recognition.compare_faces(
-            [student_face_encoding], attendance_face_encoding, TOLERANCE)
+        queued = False
+        try:
+            if StudentAttendance.objects.filter(student=student, attendance=attendance).exists():
+                return Response(
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                    data={
+                        "message": "This student is already on the list"
+                    }
+                )
 
-        print("Call response")
-        print(result)
+            if identify:
+                # already matched against the enrolled faces
+                pass
+            elif is_async(request):
+                job = AttendanceJob(
+                    student=student,
+                    attendance=attendance,
+                    image=image,
+                    lat=lat,
+                    long=long
+                )
+                job.save()
+
+                if not jobs.submit(job):
+                    job.image.delete(save=False)
+                    job.delete()
+                    return Response(
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        data={
+                            "message": "Too many attendance submissions right now, please try again shortly"
+                        }
+                    )
+
+                # the job releases the claim when it finishes
+                queued = True
+                return Response(
+                    status=status.HTTP_202_ACCEPTED,
+                    data=AttendanceJobSerializer(job).data
+                )
 
-        if result[0]:
+            else:
+                # the face check runs on the upload buffer, nothing is written unless it matches
+                data = image.read()
+                try:
+                    message = verify_face(student, data)
+                except face_engine.EngineTimeout:
+                    return face_engine_unavailable()
+
+                if message:
+                    quarantine.store(data, image.name, matric_number, message)
+
+                    return Response(
+                        status=status.HTTP_406_NOT_ACCEPTABLE,
+                        data={
+                            "message": message
+                        }
+                    )
+
+            image.seek(0)
+
+            student_attendance = StudentAttendance()
+            student_attendance.student = student
+            student_attendance.attendance = attendance
+            student_attendance.attendance_image = image
+            student_attendance.lat = lat
+            student_attendance.long = long
+            student_attendance.distance = distance
             student_attendance.commit = True
             student_attendance.datetime = timezone.now()
-            student_attendance.save()
 
+            if not marking.insert(student_attendance):
+                student_attendance.attendance_image.delete(save=False)
+                return Response(
+                    status=status.HTTP_405_METHOD_NOT_ALLOWED,
+                    data={
+                        "message": "This student is already on the list"
+                    }
+                )
+        finally:
+            if not queued:
+                marking.release(student.pk, attendance.pk)
+
+        return Response(
+            {
+                "datetime": student_attendance.datetime,
+                "matric_number": student.matric_number
+            }
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    def sync(self, request):
+        try:
+            items = json.loads(request.data.get("items", "[]"))
+        except (TypeError, ValueError):
+            items = None
+
+        if not isinstance(items, list) or not items:
             return Response(
-                {
-                    "datetime": student_attendance.datetime
-                }
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={"message": "Please provide the queued submissions"}
             )
-        else:
-            student_attendance.delete()
 
+        limit = getattr(settings, "ATTENDANCE_SYNC_MAX_ITEMS", 50)
+        if len(items) > limit:
             return Response(
-                status=status.HTTP_406_NOT_ACCEPTABLE,
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                data={"message": f"Please send at most {limit} submissions at a time"}
+            )
+
+        return Response(
+            {
+                "results": sync_submissions(items, request.FILES)
+            }
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path=r'job/(?P<job_id>[^/.]+)')
+    def job(self, request, job_id=None):
+        try:
+            wait = float(request.query_params.get("wait", 0))
+        except ValueError:
+            wait = 0
+
+        try:
+            job = jobs.wait_for(job_id, wait)
+        except (AttendanceJob.DoesNotExist, ValidationError):
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
                 data={
-                    "message": f"Sorry your face did not match with the one you submitted during enrollment"
+                    "message": "Attendance submission not found"
                 }
             )
 
+        return Response(
+            AttendanceJobSerializer(job).data
+        )
+
 
 class StudentViewSet(viewsets.ViewSet):
     queryset = Student.objects.all()
     permission_classes = [AllowAny]
 
+    @idempotent("enroll")
     def create(self, request):
 
         matric_number = request.data.get("matric_number", None)
@@ -802,8 +990,12 @@ class StudentViewSet(viewsets.ViewSet):
             student = Student(image=image, matric_number=matric_number)
             student.save()
 
-            image = face_recognition.load_image_file(student.image.path)
-            face_location_list = face_recognition.face_locations(image)
+            try:
+                analysis = face_engine.analyse(student.image.path)
+            except face_engine.EngineTimeout:
+                student.delete()
+                return face_engine_unavailable()
+            face_location_list = analysis.locations
 
             if len(face_location_list) > 1:
                 student.delete()
@@ -822,6 +1014,18 @@ class StudentViewSet(viewsets.ViewSet):
                     }
                 )
 
+            if getattr(settings, "FACE_DUPLICATE_CHECK", True) and find_enrolled(analysis.encoding):
+                student.delete()
+                return Response(
+                    status=status.HTTP_409_CONFLICT,
+                    data={
+                        "message": "This face has already been enrolled with another matric number"
+                    }
+                )
+
+            student.set_face_encoding(analysis.encoding)
+            student.save(update_fields=['encoding'])
+
             return Response(
                 status=status.HTTP_201_CREATED,
                 data={
@@ -829,6 +1033,39 @@ class StudentViewSet(viewsets.ViewSet):
                 }
             )
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    @lecturer_only
+    def bulk(self, request):
+        archive = request.FILES.get("archive")
+        students = request.FILES.get("students")
+
+        if not archive or not students:
+            return Response(
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={
+                    "message": "Please provide a zip archive of images and a CSV of matric numbers"
+                }
+            )
+
+        try:
+            report = enroll_archive(archive, students)
+        except zipfile.BadZipFile:
+            return Response(
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={
+                    "message": "The archive is not a valid zip file"
+                }
+            )
+
+        enrolled = len([entry for entry in report if entry["status"] == "ENROLLED"])
+        return Response(
+            {
+                "enrolled": enrolled,
+                "failed": len(report) - enrolled,
+                "report": report
+            }
+        )
+
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def check(self, request):
         matric_number = request.query_params.get("matric_number", None)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ServerAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'server_app'
+
+    def ready(self):
+        from server_app import signals
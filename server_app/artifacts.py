@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from server_app import exports
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def directory():
+    return getattr(settings, "EXPORT_CACHE_DIR", None)
+
+
+def max_bytes():
+    return getattr(settings, "EXPORT_CACHE_MAX_BYTES", 200 * 1024 * 1024)
+
+
+def max_age():
+    return getattr(settings, "EXPORT_CACHE_MAX_AGE", 7 * 24 * 60 * 60)
+
+
+def etag(key):
+    """Strong ETag of an export. key names the export and the course version
+    it was built from, so any change to the course's attendance changes it."""
+    return quote_etag(hashlib.sha256(repr(key).encode()).hexdigest()[:32])
+
+
+def is_fresh(request, tag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return "*" in tags or tag in tags
+
+
+def not_modified(tag):
+    response = HttpResponseNotModified()
+    response["ETag"] = tag
+    return response
+
+
+def with_etag(response, tag):
+    response["ETag"] = tag
+    # clients keep the file but must revalidate, which is one version check
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def serve(request, key, filename, output, sheets):
+    """Responds with an export file, built by sheets() only when neither the
+    client nor the artifact cache in EXPORT_CACHE_DIR already has it."""
+    tag = etag(key)
+    if is_fresh(request, tag):
+        return not_modified(tag)
+
+    cache_dir = directory()
+    if not cache_dir:
+        return with_etag(exports.stream_response(output, sheets(), filename), tag)
+
+    # artifacts are named after their ETag, a changed course gets new names
+    path = os.path.join(cache_dir, f"{tag.strip(chr(34))}.{output}")
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        build(path, output, sheets())
+        evict(cache_dir, keep=path)
+
+    return with_etag(exports.file_response(open(path, "rb"), output, filename), tag)
+
+
+def build(path, output, sheets):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    # written under a temporary name and moved into place, a concurrent
+    # request never serves half a file
+    file = tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False)
+    try:
+        with file:
+            exports.write(output, sheets, file)
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+
+def evict(directory, keep=None):
+    """Drops artifacts older than EXPORT_CACHE_MAX_AGE, then the least
+    recently served ones until the cache fits EXPORT_CACHE_MAX_BYTES."""
+    with _lock:
+        now = time.time()
+        entries = []
+        for entry in os.scandir(directory):
+            if not entry.is_file() or entry.name.endswith(".part") or entry.path == keep:
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        limit = max_bytes()
+        for modified, size, path in sorted(entries):
+            if now - modified <= max_age() and total <= limit:
+                break
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.exception("Could not evict export artifact %s", path)
@@ -0,0 +1,36 @@
+import secrets
+import string
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+ALPHABET = string.ascii_uppercase + string.digits
+ATTEMPTS = 10
+
+
+def code_length():
+    return getattr(settings, "ATTENDANCE_CODE_LENGTH", 6)
+
+
+def generate(size=None):
+    return ''.join(secrets.choice(ALPHABET) for _ in range(size or code_length()))
+
+
+def save_with_code(attendance):
+    """Saves a new session under a fresh random code.
+
+    The partial unique constraint on uncommitted codes is the index of codes
+    in use: a collision fails the insert and another code is drawn, so
+    allocation costs one insert in the common case. Codes of committed
+    sessions are free to be drawn again.
+    """
+    for attempt in range(ATTEMPTS):
+        attendance.code = generate()
+        try:
+            with transaction.atomic():
+                attendance.save()
+            return attendance
+        except IntegrityError:
+            if attempt == ATTEMPTS - 1:
+                raise
+            attendance.pk = None
@@ -0,0 +1,138 @@
+import csv
+import io
+import os
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from server_app import face_engine
+from server_app.face_index import FaceIndex
+from server_app.models import Student
+from server_app.verification import identify_tolerance, match_faces
+
+
+def chunk_size():
+    return getattr(settings, "ENROLLMENT_CHUNK_SIZE", 32)
+
+
+def check_duplicates():
+    return getattr(settings, "FACE_DUPLICATE_CHECK", True)
+
+
+def read_rows(csv_file):
+    """Yields (row number, matric number, image name) from a CSV with
+    matric_number and image columns."""
+    if isinstance(csv_file, (str, os.PathLike)):
+        csv_file = open(csv_file, "rb")
+    reader = csv.DictReader(io.TextIOWrapper(csv_file, encoding="utf-8-sig", newline=""))
+
+    for number, row in enumerate(reader, start=2):
+        yield number, (row.get("matric_number") or "").strip(), (row.get("image") or "").strip()
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def enroll_archive(archive, csv_file):
+    """Enrolls every student listed in the CSV from the images in the zip archive.
+
+    The archive is read ENROLLMENT_CHUNK_SIZE images at a time, each chunk is
+    analysed in parallel on the face engine workers and bulk inserted before
+    the next one is read, so memory stays bounded and later chunks are
+    checked against the faces of earlier ones. Returns one report entry per
+    CSV row.
+    """
+    report = []
+    seen = set()
+    image_field = Student._meta.get_field('image')
+
+    with zipfile.ZipFile(archive) as zip_file:
+        members = {
+            os.path.basename(info.filename): info
+            for info in zip_file.infolist() if not info.is_dir()
+        }
+
+        for batch in _batches(read_rows(csv_file), chunk_size()):
+            matric_numbers = [matric_number for _, matric_number, _ in batch]
+            enrolled = set(Student.objects.filter(
+                matric_number__in=matric_numbers).values_list('matric_number', flat=True))
+
+            jobs = []
+            students = []
+            for number, matric_number, image_name in batch:
+                message = None
+                if not matric_number or not image_name:
+                    message = "Missing matric number or image"
+                elif matric_number in enrolled or matric_number in seen:
+                    message = "Looks like this student matric number has been enrolled"
+                elif os.path.basename(image_name) not in members:
+                    message = "Image not found in the archive"
+
+                if message:
+                    report.append(failed(number, matric_number, message))
+                    continue
+
+                seen.add(matric_number)
+                data = zip_file.read(members[os.path.basename(image_name)])
+                jobs.append((number, matric_number, image_name, data))
+
+            analyses = face_engine.analyse_many([data for _, _, _, data in jobs])
+
+            # one distance computation against the enrolled faces for the whole batch
+            single = [analysis.encoding for analysis in analyses
+                      if not isinstance(analysis, Exception) and len(analysis.locations) == 1]
+            duplicates = iter(match_faces(single) if check_duplicates() else [(None, 0)] * len(single))
+            # faces accepted from this batch, which the database does not have yet
+            accepted = FaceIndex(capacity=max(1, len(single)))
+
+            for (number, matric_number, image_name, data), analysis in zip(jobs, analyses):
+                if isinstance(analysis, face_engine.EngineTimeout):
+                    report.append(failed(number, matric_number, "Image could not be checked in time, please retry"))
+                elif isinstance(analysis, Exception):
+                    report.append(failed(number, matric_number, "Image could not be read"))
+                elif len(analysis.locations) > 1:
+                    report.append(failed(
+                        number, matric_number,
+                        f"{len(analysis.locations)} faces were detected, only one face should be in the image"))
+                elif len(analysis.locations) < 1:
+                    report.append(failed(number, matric_number, "No face was detected"))
+                elif next(duplicates)[0] is not None or (
+                        check_duplicates() and accepted.match(analysis.encoding, identify_tolerance()) is not None):
+                    report.append(failed(
+                        number, matric_number, "This face has already been enrolled with another matric number"))
+                else:
+                    name = default_storage.save(
+                        image_field.generate_filename(None, os.path.basename(image_name)), ContentFile(data))
+                    student = Student(matric_number=matric_number, image=name)
+                    student.set_face_encoding(analysis.encoding)
+                    students.append(student)
+                    accepted.add(number, analysis.encoding)
+                    report.append({"row": number, "matric_number": matric_number, "status": "ENROLLED"})
+
+            insert(students)
+
+    report.sort(key=lambda entry: entry["row"])
+    return report
+
+
+def failed(number, matric_number, message):
+    return {"row": number, "matric_number": matric_number, "status": "FAILED", "message": message}
+
+
+def insert(students):
+    if not students:
+        return
+
+    # bulk_create sends no post_save, the next match_faces call refreshes the
+    # face index from the database and picks these up
+    Student.objects.bulk_create(students)
@@ -0,0 +1,174 @@
+import csv
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import openpyxl as excel
+from django.http import FileResponse, StreamingHttpResponse
+
+from server_app.models import Attendance, CourseStudentTally, StudentAttendance, convertDatetimeToString
+
+CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+}
+
+# presence is a (students x sessions) boolean matrix, rows follow matric_numbers
+# and columns follow sessions
+CourseMatrix = namedtuple("CourseMatrix", ["sessions", "matric_numbers", "presence"])
+Scores = namedtuple("Scores", ["presents", "absents", "total", "marks"])
+
+
+def course_matrix(course):
+    """Attendance of every student who attended the course at least once,
+    from one query for the sessions and one for the entries."""
+    sessions = list(Attendance.objects.filter(course=course).order_by('pk').values_list('pk', 'datetime'))
+
+    # only entries of the sessions read above, a session committed in between is left out
+    entries = list(StudentAttendance.objects.filter(
+        attendance_id__in=[session_id for session_id, _ in sessions]
+    ).values_list('student__matric_number', 'attendance_id'))
+
+    session_ids = np.array([session_id for session_id, _ in sessions], dtype=np.int64)
+    if not entries or not len(session_ids):
+        return CourseMatrix(sessions, [], np.zeros((0, len(session_ids)), dtype=bool))
+
+    matric_numbers, rows = np.unique(np.array([entry[0] for entry in entries]), return_inverse=True)
+
+    attendance_ids = np.array([entry[1] for entry in entries], dtype=np.int64)
+    # sessions are in primary key order
+    columns = np.searchsorted(session_ids, attendance_ids)
+
+    presence = np.zeros((len(matric_numbers), len(session_ids)), dtype=bool)
+    presence[rows, columns] = True
+
+    return CourseMatrix(sessions, matric_numbers.tolist(), presence)
+
+
+def scores(course, matrix, mark=1):
+    """Marks of the matrix's students, from the course's session count and
+    per-student tallies kept by server_app.tallies instead of the matrix."""
+    tallies = dict(CourseStudentTally.objects.filter(course=course).values_list('student__matric_number', 'present'))
+
+    total = course.session_count
+    presents = np.array([tallies.get(matric_number, 0) for matric_number in matrix.matric_numbers], dtype=np.int64)
+    marks = presents / total * mark if total else np.zeros(len(presents))
+    return Scores(presents, np.maximum(total - presents, 0), total, marks)
+
+
+def session_dates(matrix):
+    return [convertDatetimeToString(datetime) if datetime else "" for _, datetime in matrix.sessions]
+
+
+def to_json(matrix, score):
+    return {
+        "sessions": [
+            {"id": session_id, "date": date}
+            for (session_id, _), date in zip(matrix.sessions, session_dates(matrix))
+        ],
+        "students": matrix.matric_numbers,
+        "presence": matrix.presence.astype(np.uint8).tolist(),
+        "total": score.total,
+        "presents": score.presents.tolist(),
+        "absents": score.absents.tolist(),
+        "marks": np.round(score.marks, 4).tolist()
+    }
+
+
+def session_sheet(attendance):
+    """Rows of one session's export, read from the database in chunks."""
+    yield ["Student Matric Number", "Date"]
+
+    entries = StudentAttendance.objects.filter(attendance=attendance).order_by('pk').values_list(
+        'student__matric_number', 'datetime')
+    for matric_number, datetime in entries.iterator(chunk_size=2000):
+        yield [matric_number, convertDatetimeToString(datetime, True) if datetime else ""]
+
+
+def attendance_sheet(matrix):
+    yield ["Student Matric Number"] + session_dates(matrix)
+
+    for matric_number, row in zip(matrix.matric_numbers, matrix.presence):
+        yield [matric_number] + ["Present" if present else "" for present in row]
+
+
+def score_sheet(matrix, score):
+    yield ["Matric Number", "Presents", "Absent", "Total", "Mark"]
+
+    for matric_number, presents, absents, marks in zip(
+            matrix.matric_numbers, score.presents.tolist(), score.absents.tolist(), score.marks.tolist()):
+        yield [matric_number, presents, absents, score.total, marks]
+
+
+def course_table(matrix, score):
+    """The whole course export as one table, for CSV."""
+    yield ["Student Matric Number"] + session_dates(matrix) + ["Presents", "Absent", "Total", "Mark"]
+
+    for index, (matric_number, row) in enumerate(zip(matrix.matric_numbers, matrix.presence)):
+        yield [matric_number] + ["Present" if present else "" for present in row] + [
+            int(score.presents[index]), int(score.absents[index]), score.total, float(score.marks[index])]
+
+
+def session_sheets(attendance):
+    return [("Attendance", session_sheet(attendance))]
+
+
+def course_sheets(course, output, mark=1):
+    matrix = course_matrix(course)
+    score = scores(course, matrix, mark)
+    if output == "csv":
+        return [("Attendance", course_table(matrix, score))]
+    return [("Attendance", attendance_sheet(matrix)), ("Students Scores", score_sheet(matrix, score))]
+
+
+def write_xlsx(sheets, file):
+    """Writes (title, rows) sheets with a write-only workbook, which keeps
+    rows on disk instead of building the sheet in memory."""
+    workbook = excel.Workbook(write_only=True)
+    for title, rows in sheets:
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(file)
+
+
+def write_csv(sheets, file):
+    # CSV has no sheets, only the first one is written
+    for line in csv_lines(sheets[0][1]):
+        file.write(line.encode("utf-8"))
+
+
+def write(output, sheets, file):
+    if output == "csv":
+        write_csv(sheets, file)
+    else:
+        write_xlsx(sheets, file)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def file_response(file, output, filename):
+    return FileResponse(
+        file, as_attachment=True, filename=f"{filename}.{output}", content_type=CONTENT_TYPES[output])
+
+
+def stream_response(output, sheets, filename):
+    if output == "csv":
+        response = StreamingHttpResponse(csv_lines(sheets[0][1]), content_type=CONTENT_TYPES["csv"])
+        response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return response
+
+    # every export gets its own anonymous file, deleted once it is sent
+    file = tempfile.TemporaryFile()
+    write_xlsx(sheets, file)
+    file.seek(0)
+    return file_response(file, output, filename)
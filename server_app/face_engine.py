@@ -0,0 +1,164 @@
+import multiprocessing
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+
+TOLERANCE = 0.42
+
+# what server_app.faces.analyse and analyse_group return, built here from
+# their plain tuples so the web process never imports server_app.faces
+Analysis = namedtuple("Analysis", ["locations", "encoding", "original_size", "size"])
+
+_lock = threading.Lock()
+_executor = None
+
+
+class EngineTimeout(Exception):
+    """A worker did not answer within FACE_ENGINE_TIMEOUT. Not an OSError,
+    the image may be fine and the request worth retrying."""
+
+
+def workers():
+    return getattr(settings, "FACE_ENGINE_WORKERS", 0)
+
+
+def _context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        # the fork server imports dlib and its models once, every worker is
+        # forked from it and shares those pages
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["server_app.faces"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _pool():
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers(),
+                mp_context=_context(),
+                initializer=_run,
+                initargs=("warm_up",))
+        return _executor
+
+
+def start():
+    """Starts the worker processes now instead of on the first request."""
+    if workers() < 1:
+        return
+
+    executor = _pool()
+    futures = [executor.submit(int, 0) for _ in range(workers())]
+    for future in futures:
+        future.result()
+
+
+def shutdown():
+    global _executor
+
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(name, *args):
+    # only the workers import server_app.faces, and with it dlib
+    from server_app import faces
+
+    return getattr(faces, name)(*args)
+
+
+def _call(name, *args):
+    return _call_many(name, [args])[0]
+
+
+def _call_many(name, calls, return_exceptions=False):
+    """Runs one call per argument tuple, spread over the workers.
+
+    With return_exceptions an image that fails (unreadable, corrupt, or a
+    worker that timed out) gives its exception in place of the result instead
+    of failing the whole batch.
+    """
+    if workers() < 1:
+        return [_result(lambda: _run(name, *args), return_exceptions) for args in calls]
+
+    timeout = getattr(settings, "FACE_ENGINE_TIMEOUT", 30)
+    try:
+        futures = [_pool().submit(_run, name, *args) for args in calls]
+        return [_result(lambda: _wait(future, timeout), return_exceptions) for future in futures]
+    except BrokenProcessPool:
+        # a worker died (usually out of memory), replace the pool and retry once
+        shutdown()
+        futures = [_pool().submit(_run, name, *args) for args in calls]
+        return [_result(lambda: _wait(future, timeout), return_exceptions) for future in futures]
+
+
+def _wait(future, timeout):
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        # a call still queued is dropped, one already running finishes unread
+        future.cancel()
+        raise EngineTimeout(f"The face engine did not answer within {timeout}s")
+
+
+def _result(call, return_exceptions):
+    if not return_exceptions:
+        return call()
+    try:
+        return call()
+    except (OSError, ValueError, EngineTimeout) as error:
+        return error
+
+
+def _analysis(result):
+    return result if isinstance(result, Exception) else Analysis(*result)
+
+
+def max_dimension():
+    return getattr(settings, "FACE_IMAGE_MAX_DIMENSION", 1024)
+
+
+def analyse(file):
+    """Returns the face locations, the encoding when there is exactly one face,
+    and the original and processed image sizes.
+
+    `file` is a path or the raw image bytes, both are cheap to send to a worker.
+    """
+    return _analysis(_call("analyse", file, max_dimension()))
+
+
+def analyse_many(files):
+    """analyse() for a batch of images in parallel, failures are returned in place."""
+    return [
+        _analysis(result)
+        for result in _call_many("analyse", [(file, max_dimension()) for file in files], return_exceptions=True)
+    ]
+
+
+def analyse_group(files):
+    """Every face of every image, each image handled by its own worker."""
+    dimension = getattr(settings, "FACE_GROUP_MAX_DIMENSION", 2400)
+    return [_analysis(result) for result in _call_many("analyse_group", [(file, dimension) for file in files])]
+
+
+def detect(file):
+    return analyse(file).locations
+
+
+def encode(file):
+    return analyse(file).encoding
+
+
+def compare(known_encoding, encoding, tolerance=TOLERANCE):
+    # a 128 float distance is far cheaper than a round trip to a worker
+    distance = np.linalg.norm(np.asarray(known_encoding) - np.asarray(encoding))
+    return bool(distance <= tolerance)
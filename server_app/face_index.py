@@ -0,0 +1,152 @@
+import datetime
+import threading
+
+import numpy as np
+
+DIMENSION = 128
+# refresh() re-reads encodings written this long before its last run, so a
+# slower transaction that commits an older timestamp late is still picked up
+REFRESH_OVERLAP = datetime.timedelta(seconds=30)
+
+
+class FaceIndex:
+    """Enrollment encodings of every student in one contiguous float32 matrix.
+
+    A nearest neighbour query is a single matrix-vector product against all
+    rows, using |a - b|^2 = |a|^2 + |b|^2 - 2 a.b with the row norms kept up
+    to date on add and remove.
+    """
+
+    def __init__(self, capacity=1024):
+        self._lock = threading.RLock()
+        self._matrix = np.empty((capacity, DIMENSION), dtype=np.float32)
+        self._norms = np.empty(capacity, dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._rows = {}
+        self._size = 0
+        # when refresh() last read the database, None before the first load
+        self.refreshed_at = None
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, student_id):
+        return student_id in self._rows
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+
+        for name in ("_matrix", "_norms", "_ids"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def add(self, student_id, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32)
+
+        with self._lock:
+            row = self._rows.get(student_id)
+            if row is None:
+                self._grow(self._size + 1)
+                row = self._size
+                self._size += 1
+                self._rows[student_id] = row
+                self._ids[row] = student_id
+
+            self._matrix[row] = encoding
+            self._norms[row] = encoding.dot(encoding)
+
+    def add_many(self, student_ids, encodings):
+        with self._lock:
+            for student_id, encoding in zip(student_ids, encodings):
+                self.add(student_id, encoding)
+
+    def remove(self, student_id):
+        with self._lock:
+            row = self._rows.pop(student_id, None)
+            if row is None:
+                return
+
+            # move the last row into the hole to keep the matrix dense
+            last = self._size - 1
+            if row != last:
+                moved = int(self._ids[last])
+                self._matrix[row] = self._matrix[last]
+                self._norms[row] = self._norms[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._size = last
+
+    def search(self, encodings):
+        """For each query encoding returns (student id, distance) of the nearest row.
+
+        The whole batch is one (queries x students) distance computation.
+        """
+        queries = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+
+        with self._lock:
+            if self._size == 0 or len(queries) == 0:
+                return [(None, float("inf"))] * len(queries)
+
+            size = self._size
+            squared = (
+                np.einsum("ij,ij->i", queries, queries)[:, None]
+                + self._norms[:size][None, :]
+                - 2 * queries.dot(self._matrix[:size].T)
+            )
+            nearest = squared.argmin(axis=1)
+            ids = self._ids[nearest]
+
+        distances = np.sqrt(np.maximum(squared[np.arange(len(queries)), nearest], 0))
+        return [(int(student_id), float(distance)) for student_id, distance in zip(ids, distances)]
+
+    def match(self, encoding, tolerance):
+        """Returns the id of the closest student within tolerance, or None."""
+        student_id, distance = self.search([encoding])[0]
+        if distance > tolerance:
+            return None
+        return student_id
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def loaded():
+    return _index
+
+
+def get_index():
+    """The process wide index, loaded from the database on first use and then
+    topped up with encodings other processes have written since."""
+    global _index
+
+    with _lock:
+        if _index is None:
+            from server_app.models import Student
+
+            _index = FaceIndex(capacity=max(1024, Student.objects.count()))
+        index = _index
+
+    refresh(index)
+    return index
+
+
+def refresh(index):
+    from django.utils import timezone
+
+    from server_app.models import Student
+
+    started = timezone.now()
+    students = Student.objects.filter(encoding__isnull=False)
+    if index.refreshed_at is not None:
+        students = students.filter(encoding_updated__gte=index.refreshed_at - REFRESH_OVERLAP)
+
+    for student_id, encoding in students.values_list('pk', 'encoding').order_by('pk').iterator(chunk_size=2000):
+        index.add(student_id, np.frombuffer(bytes(encoding), dtype=np.float32))
+    index.refreshed_at = started
@@ -0,0 +1,80 @@
+import io
+
+import numpy as np
+import face_recognition
+from PIL import Image, ImageOps
+
+# Runs inside the face engine workers (see server_app.face_engine), keep it
+# free of Django imports so the workers stay small. Results are plain tuples:
+# unpickling anything defined here would import dlib into the web process.
+
+MAX_DIMENSION = 1024
+
+
+def normalize(file, max_dimension=MAX_DIMENSION):
+    """Decodes an upload into the RGB uint8 array dlib expects.
+
+    The image is rotated by its EXIF orientation and scaled down so neither
+    side is above `max_dimension`. JPEGs are decoded at a reduced scale
+    straight away instead of at full camera resolution.
+    Returns the array with the original and processed (width, height).
+    """
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        file = io.BytesIO(file)
+
+    image = Image.open(file)
+    original_size = image.size
+
+    if max_dimension:
+        # only JPEG honours draft, it picks the smallest 1/2, 1/4 or 1/8
+        # scale that is still at least max_dimension on each side
+        image.draft("RGB", (max_dimension, max_dimension))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+
+    return np.array(image), original_size, image.size
+
+
+def find_faces(image):
+    return face_recognition.face_locations(image)
+
+
+def encode_face(image, location):
+    # reuse the box from find_faces so detection only runs once per image
+    return face_recognition.face_encodings(image, [location])[0]
+
+
+def analyse(file, max_dimension=MAX_DIMENSION):
+    """Detects faces and, when there is exactly one, encodes it.
+
+    Returns (locations, encoding, original size, size), see face_engine.Analysis.
+    """
+    image, original_size, size = normalize(file, max_dimension)
+    face_location_list = find_faces(image)
+
+    encoding = None
+    if len(face_location_list) == 1:
+        encoding = encode_face(image, face_location_list[0])
+
+    return face_location_list, encoding, original_size, size
+
+
+def analyse_group(file, max_dimension=MAX_DIMENSION):
+    """Detects every face and encodes them all in one batch."""
+    image, original_size, size = normalize(file, max_dimension)
+    face_location_list = find_faces(image)
+    encodings = face_recognition.face_encodings(image, face_location_list)
+
+    return face_location_list, np.array(encodings).reshape(-1, 128), original_size, size
+
+
+def warm_up():
+    # the first call into dlib pages in the detector and the ResNet weights
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(image)
+    face_recognition.face_encodings(image, [(0, 63, 63, 0)])
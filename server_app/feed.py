@@ -0,0 +1,212 @@
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import exceptions
+
+from server_app import live
+
+PATH = re.compile(r"^/api/attendance-view/(?P<pk>\d+)/live/?$")
+
+
+def keepalive():
+    return getattr(settings, "LIVE_KEEPALIVE", 15)
+
+
+def match(scope):
+    """The attendance id when the scope is a live feed request, else None."""
+    if scope["type"] not in ("http", "websocket"):
+        return None
+    found = PATH.match(scope["path"])
+    return int(found.group("pk")) if found else None
+
+
+def scope_token(scope):
+    # EventSource and browser websockets cannot set headers, so ?token= works too
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            parts = value.decode("latin-1").split(" ")
+            if len(parts) > 1 and parts[1]:
+                return parts[1]
+    tokens = parse_qs(scope.get("query_string", b"").decode()).get("token")
+    return tokens[0] if tokens else None
+
+
+def authorize(token, attendance_id):
+    """(attendance, None) for the lecturer who owns the session, else
+    (None, (status, message))."""
+    from server_app.models import Attendance
+    from server_app.verify import resolve_token
+
+    if not token:
+        return None, (401, "Please login first")
+    try:
+        principal = resolve_token(token)
+    except exceptions.AuthenticationFailed as error:
+        return None, (401, str(error.detail))
+
+    if principal.lecturer is None:
+        return None, (403, "Please login as a lecturer, to access this")
+
+    attendance = Attendance.objects.select_related('course').filter(pk=attendance_id).first()
+    if attendance is None:
+        return None, (404, "Attendance not found")
+    if attendance.course.lecturer_id != principal.lecturer.pk:
+        return None, (403, "You cant view courses attendances that are not yours")
+    return attendance, None
+
+
+async def events(attendance):
+    """Snapshot of the session followed by every change after it.
+
+    The subscription starts before the snapshot is read, so nothing
+    committed in between is missed; entries already in the snapshot are
+    not sent again.
+    """
+    subscription = live.broker().subscribe(live.topic(attendance.pk))
+    try:
+        await subscription.ready.wait()
+        while True:
+            await sync_to_async(attendance.refresh_from_db)()
+            state = await sync_to_async(live.snapshot)(attendance)
+            seen = {entry["id"] for entry in state["entries"]}
+            yield state
+
+            while True:
+                try:
+                    event = await subscription.get(keepalive())
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                if event is live.OVERFLOW:
+                    break
+                if event["type"] == "marked" and event["id"] in seen:
+                    continue
+                yield event
+    finally:
+        subscription.close()
+
+
+async def until_disconnect(receive, kind):
+    while True:
+        message = await receive()
+        if message["type"] == kind:
+            return
+
+
+async def relay(receive, kind, attendance, send_event):
+    """Sends events until the client disconnects."""
+    stream = events(attendance)
+    disconnected = asyncio.ensure_future(until_disconnect(receive, kind))
+    following = None
+    try:
+        while True:
+            following = asyncio.ensure_future(stream.__anext__())
+            done, _ = await asyncio.wait({following, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                return
+            await send_event(following.result())
+    finally:
+        disconnected.cancel()
+        if following is not None and not following.done():
+            # the generator can only be closed once its pending step has stopped
+            following.cancel()
+            await asyncio.gather(following, return_exceptions=True)
+        await stream.aclose()
+
+
+async def sse(scope, receive, send, attendance_id):
+    attendance, error = await sync_to_async(authorize)(scope_token(scope), attendance_id)
+    if error:
+        status, message = error
+        await send({
+            "type": "http.response.start", "status": status,
+            "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": json.dumps({"message": message}).encode()})
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]
+    })
+
+    async def send_event(event):
+        if event is None:
+            body = b": keepalive\n\n"
+        else:
+            body = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    try:
+        await relay(receive, "http.disconnect", attendance, send_event)
+    finally:
+        try:
+            await send({"type": "http.response.body", "body": b""})
+        except Exception:
+            pass
+
+
+async def websocket(scope, receive, send, attendance_id):
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    attendance, error = await sync_to_async(authorize)(scope_token(scope), attendance_id)
+    if error:
+        await send({"type": "websocket.close", "code": 4000 + error[0]})
+        return
+
+    await send({"type": "websocket.accept"})
+
+    async def send_event(event):
+        if event is not None:
+            await send({"type": "websocket.send", "text": json.dumps(event)})
+
+    await relay(receive, "websocket.disconnect", attendance, send_event)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def not_found(scope, send):
+    if scope["type"] == "websocket":
+        await send({"type": "websocket.close"})
+        return
+    await send({
+        "type": "http.response.start", "status": 404,
+        "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps({"message": "Not found"}).encode()})
+
+
+async def application(scope, receive, send):
+    """Serves only /api/attendance-view/<id>/live/, over SSE or WebSocket.
+
+    Runs in its own ASGI process (server.live_asgi) beside the WSGI API, so
+    the API's blocking long-polls never share a thread with the feed.
+    """
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    attendance_id = match(scope)
+    if attendance_id is None:
+        return await not_found(scope, send)
+
+    if scope["type"] == "websocket":
+        return await websocket(scope, receive, send, attendance_id)
+    return await sse(scope, receive, send, attendance_id)
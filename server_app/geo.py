@@ -0,0 +1,43 @@
+import math
+
+EARTH_RADIUS = 6371008.8
+
+
+def parse_coordinate(value, limit):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(value) or abs(value) > limit:
+        return None
+    return value
+
+
+def parse_position(lat, long):
+    """Returns (lat, long) as floats, or None when either is missing or out of range."""
+    lat = parse_coordinate(lat, 90)
+    long = parse_coordinate(long, 180)
+    if lat is None or long is None:
+        return None
+    return lat, long
+
+
+def haversine(lat1, long1, lat2, long2):
+    """Great circle distance in metres."""
+    lat1, long1, lat2, long2 = map(math.radians, (lat1, long1, lat2, long2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def check_position(attendance, lat, long):
+    """Returns (distance from the session in metres, rejection message or None)."""
+    if attendance.lat is None or attendance.long is None:
+        return None, None
+
+    distance = haversine(attendance.lat, attendance.long, lat, long)
+    if attendance.radius and distance > attendance.radius:
+        return distance, (
+            f"Sorry you are {distance:.0f}m away from the lecture, "
+            f"you need to be within {attendance.radius:.0f}m to attend")
+    return distance, None
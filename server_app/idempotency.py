@@ -0,0 +1,140 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+POLL_INTERVAL = 0.2
+
+# outcomes a retry should not be stuck with
+TRANSIENT = (status.HTTP_409_CONFLICT, status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+_lock = threading.Lock()
+_events = {}
+
+
+def ttl():
+    return getattr(settings, "IDEMPOTENCY_TTL", 24 * 60 * 60)
+
+
+def lock_timeout():
+    return getattr(settings, "IDEMPOTENCY_LOCK_TIMEOUT", 120)
+
+
+def max_wait():
+    return getattr(settings, "IDEMPOTENCY_MAX_WAIT", 25)
+
+
+def fingerprint(request):
+    """Identifies the request a key was first used with: its fields and the
+    name and size of every uploaded file."""
+    digest = hashlib.sha256(request.path.encode())
+    for name in sorted(request.data.keys()):
+        if name in request.FILES:
+            continue
+        digest.update(f"{name}={request.data.get(name)}\n".encode())
+    for name in sorted(request.FILES.keys()):
+        upload = request.FILES[name]
+        digest.update(f"{name}:{upload.name}:{upload.size}\n".encode())
+    return digest.hexdigest()
+
+
+def replay(entry):
+    response = Response(status=entry["status"], data=entry["data"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def wait_for(cache_key):
+    """Waits for the request holding cache_key to finish, returns its entry or
+    None when it is still running after IDEMPOTENCY_MAX_WAIT seconds."""
+    deadline = time.monotonic() + max_wait()
+
+    while True:
+        entry = cache.get(cache_key)
+        if entry is None or entry.get("status") is not None:
+            return entry
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+
+        with _lock:
+            event = _events.get(cache_key)
+
+        # the original may be running in another process, then poll the cache
+        if event is not None:
+            event.wait(min(remaining, POLL_INTERVAL * 5))
+        else:
+            time.sleep(min(remaining, POLL_INTERVAL))
+
+
+def idempotent(scope):
+    """Lets a view be retried safely with an Idempotency-Key header.
+
+    The first request with a key runs the view and its response is kept in
+    the default cache for IDEMPOTENCY_TTL seconds. A repeat gets that
+    response back without running the view, and a repeat that arrives
+    while the first is still running waits for its result.
+    """
+
+    def decorator(function):
+
+        @wraps(function)
+        def wrap(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return function(self, request, *args, **kwargs)
+
+            cache_key = f"idempotency:{scope}:{key[:200]}"
+            request_fingerprint = fingerprint(request)
+
+            while not cache.add(cache_key, {"fingerprint": request_fingerprint, "status": None}, lock_timeout()):
+                entry = wait_for(cache_key)
+                if entry is None:
+                    if cache.get(cache_key) is None:
+                        # the original gave up without an outcome, run it here
+                        continue
+                    return Response(
+                        status=status.HTTP_409_CONFLICT,
+                        data={"message": "This request is still being processed, please try again shortly"}
+                    )
+
+                if entry["fingerprint"] != request_fingerprint:
+                    return Response(
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        data={"message": f"This {HEADER} was already used for a different request"}
+                    )
+                return replay(entry)
+
+            event = threading.Event()
+            with _lock:
+                _events[cache_key] = event
+
+            stored = False
+            try:
+                response = function(self, request, *args, **kwargs)
+
+                if response.status_code < 500 and response.status_code not in TRANSIENT:
+                    cache.set(cache_key, {
+                        "fingerprint": request_fingerprint,
+                        "status": response.status_code,
+                        "data": response.data
+                    }, ttl())
+                    stored = True
+                return response
+            finally:
+                if not stored:
+                    cache.delete(cache_key)
+                with _lock:
+                    _events.pop(cache_key, None)
+                event.set()
+
+        return wrap
+
+    return decorator
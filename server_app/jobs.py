@@ -0,0 +1,172 @@
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from server_app import marking, quarantine
+from server_app.geo import check_position
+from server_app.models import AttendanceJob, StudentAttendance
+from server_app.verification import verify_face
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+_events = {}
+
+
+def _pool():
+    global _executor, _slots
+
+    with _lock:
+        if _executor is None:
+            workers = getattr(settings, "ATTENDANCE_JOB_WORKERS", 2)
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="attendance-job")
+            _slots = threading.BoundedSemaphore(
+                getattr(settings, "ATTENDANCE_JOB_QUEUE_SIZE", 200))
+    return _executor, _slots
+
+
+def submit(job):
+    """Queues the job on the in-process pool, False when the queue is full."""
+    executor, slots = _pool()
+
+    if not slots.acquire(blocking=False):
+        return False
+
+    key = str(job.pk)
+    with _lock:
+        _events[key] = threading.Event()
+
+    executor.submit(_work, key)
+    return True
+
+
+def _work(job_id):
+    try:
+        run(job_id)
+    except Exception:
+        logger.exception("Attendance job %s failed", job_id)
+    finally:
+        _pool()[1].release()
+        close_old_connections()
+        with _lock:
+            event = _events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+
+def run(job_id):
+    # claiming with a conditional update keeps a job from running twice when
+    # both the web process and run_attendance_jobs pick it up
+    claimed = AttendanceJob.objects.filter(
+        pk=job_id, status='PENDING').update(status='RUNNING', started=timezone.now())
+    if not claimed:
+        return None
+
+    job = AttendanceJob.objects.select_related(
+        'student', 'attendance').get(pk=job_id)
+
+    try:
+        process(job)
+    except Exception:
+        finish(job, 'REJECTED', "Sorry your image could not be processed, please try again")
+        raise
+
+    return job
+
+
+def stale_after():
+    # longer than any face check or the claim attend took for the job
+    return max(
+        getattr(settings, "ATTENDANCE_CLAIM_TIMEOUT", 60),
+        getattr(settings, "FACE_ENGINE_TIMEOUT", 30))
+
+
+def reclaim():
+    """Puts RUNNING jobs whose worker died (the web process restarted mid
+    job) back to PENDING. Returns how many were reclaimed."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=stale_after())
+    # jobs claimed before started was recorded have none
+    return AttendanceJob.objects.filter(status='RUNNING').filter(
+        Q(started__lt=cutoff) | Q(started__isnull=True)).update(status='PENDING', started=None)
+
+
+def process(job):
+    attendance = job.attendance
+
+    if not attendance.is_open or attendance.commit:
+        return finish(job, 'REJECTED', "Attendance list is no longer open")
+
+    if StudentAttendance.objects.filter(student=job.student, attendance=attendance).exists():
+        return finish(job, 'REJECTED', "This student is already on the list")
+
+    message = verify_face(job.student, job.image.path)
+    if message:
+        return finish(job, 'REJECTED', message)
+
+    student_attendance = StudentAttendance()
+    student_attendance.student = job.student
+    student_attendance.attendance = attendance
+    student_attendance.attendance_image = job.image.name
+    student_attendance.lat = job.lat
+    student_attendance.long = job.long
+    student_attendance.distance = check_position(attendance, job.lat, job.long)[0]
+    student_attendance.commit = True
+    student_attendance.datetime = timezone.now()
+    if not marking.insert(student_attendance):
+        return finish(job, 'REJECTED', "This student is already on the list")
+
+    job.student_attendance = student_attendance
+    return finish(job, 'ACCEPTED', "")
+
+
+def finish(job, job_status, message):
+    # attend claimed the student for this session when it queued the job
+    marking.release(job.student_id, job.attendance_id)
+
+    if job_status == 'REJECTED' and job.image:
+        if quarantine.enabled():
+            with job.image.open('rb') as image:
+                quarantine.store(image.read(), job.image.name, job.student.matric_number, message)
+        job.image.delete(save=False)
+
+    job.status = job_status
+    job.message = message
+    job.finished = timezone.now()
+    job.save()
+
+    return job
+
+
+def wait_for(job_id, wait=0):
+    """Long-polls a job until it is done or `wait` seconds (capped) have passed."""
+    wait = min(max(wait, 0), getattr(settings, "ATTENDANCE_JOB_MAX_WAIT", 25))
+    deadline = time.monotonic() + wait
+
+    while True:
+        job = AttendanceJob.objects.select_related(
+            'student_attendance').get(pk=job_id)
+
+        remaining = deadline - time.monotonic()
+        if job.is_done() or remaining <= 0:
+            return job
+
+        with _lock:
+            event = _events.get(str(job.pk))
+
+        # jobs queued by another process have no local event, fall back to polling
+        if event is not None:
+            event.wait(min(remaining, POLL_INTERVAL * 2))
+        else:
+            time.sleep(min(remaining, POLL_INTERVAL))
@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW = {"type": "overflow"}
+
+
+def queue_size():
+    return getattr(settings, "LIVE_QUEUE_SIZE", 500)
+
+
+def poll_interval():
+    return getattr(settings, "LIVE_POLL_INTERVAL", 1)
+
+
+class Subscription:
+    """One listener's queue of events, read on the event loop it was created on."""
+
+    def __init__(self, broker, topic, loop):
+        self.broker = broker
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size())
+        # set once every later change will be delivered, read the snapshot after it
+        self.ready = asyncio.Event()
+
+    def deliver(self, event):
+        # publish may run on any thread, the queue belongs to the loop
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():
+            # a listener this far behind is sent a fresh snapshot instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = OVERFLOW
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process publish/subscribe.
+
+    Only listeners connected to the process that committed the entry hear
+    about it. Point LIVE_BROKER at a class with the same subscribe,
+    unsubscribe and publish methods backed by a message broker to fan out
+    across processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = defaultdict(set)
+
+    def subscribe(self, topic):
+        subscription = Subscription(self, topic, asyncio.get_running_loop())
+        subscription.ready.set()
+        with self._lock:
+            self._topics[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._topics.get(subscription.topic)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._topics[subscription.topic]
+
+    def publish(self, topic, event):
+        with self._lock:
+            subscriptions = list(self._topics.get(topic, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # its event loop has closed
+                self.unsubscribe(subscription)
+
+
+class DatabaseBroker(LocalBroker):
+    """Reads every watched session's changes back from the database.
+
+    For a feed served by its own process: the API processes that store the
+    entries cannot reach its listeners, so publish() does nothing and one
+    poller per watched session turns new rows and state changes into
+    events, at most LIVE_POLL_INTERVAL seconds after they commit.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._pollers = {}
+
+    def subscribe(self, topic):
+        subscription = Subscription(self, topic, asyncio.get_running_loop())
+        with self._lock:
+            self._topics[topic].add(subscription)
+            poller = self._pollers.get(topic)
+            if poller is None:
+                ready = asyncio.Event()
+                task = asyncio.ensure_future(self._poll(topic, ready))
+                poller = self._pollers[topic] = (task, ready)
+        # the listener waits for the poller's first read
+        subscription.ready = poller[1]
+        return subscription
+
+    def publish(self, topic, event):
+        pass
+
+    async def _poll(self, topic, ready):
+        attendance_id = int(topic.split(":", 1)[1])
+        seen = set()
+        state = None
+        try:
+            while True:
+                with self._lock:
+                    if not self._topics.get(topic):
+                        return
+                try:
+                    events, state = await sync_to_async(changes)(attendance_id, state, seen)
+                except Exception:
+                    logger.exception("Could not read live changes for attendance %s", attendance_id)
+                    events = []
+                if ready.is_set():
+                    for event in events:
+                        LocalBroker.publish(self, topic, event)
+                ready.set()
+                if state is None and events:
+                    # the session was deleted
+                    return
+                await asyncio.sleep(poll_interval())
+        finally:
+            with self._lock:
+                self._pollers.pop(topic, None)
+
+
+def changes(attendance_id, state, seen):
+    """Events for what changed in a session since state, the (is_open,
+    commit, present_count, last entry id) of the previous read. seen holds
+    the ids of the entries already announced and is updated in place.
+    Returns the events and the new state, None once the session is gone."""
+    from server_app.models import Attendance, StudentAttendance
+
+    try:
+        row = Attendance.objects.filter(pk=attendance_id).annotate(
+            last=Max('studentattendance__pk')
+        ).values_list('is_open', 'commit', 'present_count', 'last').first()
+
+        if row is None:
+            deleted = {"type": "state", "id": attendance_id, "is_open": False, "commit": False, "deleted": True}
+            return ([deleted] if state is not None else []), None
+
+        events = []
+        if state is not None and row[:2] != state[:2]:
+            events.append({
+                "type": "state", "id": attendance_id, "is_open": row[0], "commit": row[1], "deleted": False})
+
+        if row[2:] != (state or ())[2:]:
+            ids = set(StudentAttendance.objects.filter(attendance_id=attendance_id).values_list('pk', flat=True))
+            new = ids - seen
+            seen.intersection_update(ids)
+            seen.update(new)
+            if state is not None and new:
+                entries = StudentAttendance.objects.listing().filter(pk__in=new).order_by('pk')
+                events.extend(entry_event(entry, entry.student.matric_number) for entry in entries)
+        return events, row
+    except DatabaseError:
+        # a dropped connection is reopened on the next poll
+        connection.close()
+        raise
+
+
+_lock = threading.Lock()
+_broker = None
+
+
+def broker():
+    global _broker
+
+    with _lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, "LIVE_BROKER", "server_app.live.DatabaseBroker"))()
+    return _broker
+
+
+def topic(attendance_id):
+    return f"attendance:{attendance_id}"
+
+
+def publish(attendance_id, event):
+    """Sends the event to the session's listeners once the current
+    transaction commits, so nobody hears about a row that was rolled back."""
+    def send():
+        try:
+            broker().publish(topic(attendance_id), event)
+        except Exception:
+            logger.exception("Could not publish live event for attendance %s", attendance_id)
+
+    transaction.on_commit(send)
+
+
+def entry_event(student_attendance, matric_number):
+    return {
+        "type": "marked",
+        "id": student_attendance.pk,
+        "matric_number": matric_number,
+        "datetime": student_attendance.datetime.isoformat() if student_attendance.datetime else None,
+        "distance": student_attendance.distance,
+        "commit": student_attendance.commit
+    }
+
+
+def state_event(attendance, deleted=False):
+    return {
+        "type": "state",
+        "id": attendance.pk,
+        "is_open": attendance.is_open,
+        "commit": attendance.commit,
+        "deleted": deleted
+    }
+
+
+def publish_marked(student_attendances, matric_numbers):
+    for student_attendance in student_attendances:
+        publish(student_attendance.attendance_id, entry_event(
+            student_attendance, matric_numbers.get(student_attendance.student_id)))
+
+
+def publish_state(attendance, deleted=False):
+    publish(attendance.pk, state_event(attendance, deleted))
+
+
+def snapshot(attendance):
+    from server_app.models import StudentAttendance
+
+    entries = StudentAttendance.objects.listing().filter(attendance=attendance).order_by('pk')
+    return {
+        "type": "snapshot",
+        "attendance": dict(state_event(attendance), present_count=attendance.present_count),
+        "entries": [entry_event(entry, entry.student.matric_number) for entry in entries]
+    }
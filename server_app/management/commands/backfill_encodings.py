@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from server_app import face_engine
+from server_app.models import Student
+
+
+class Command(BaseCommand):
+    help = "Compute and store face encodings for students enrolled without one"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Recompute encodings for every student, not only the missing ones")
+
+    def handle(self, *args, **options):
+        students = Student.objects.all()
+        if not options["all"]:
+            students = students.filter(encoding__isnull=True)
+
+        done = 0
+        failed = 0
+        for student in students.iterator():
+            try:
+                encoding = face_engine.encode(student.image.path)
+            except (OSError, ValueError, face_engine.EngineTimeout) as error:
+                failed += 1
+                self.stderr.write(f"{student.matric_number}: {error}")
+                continue
+
+            if encoding is None:
+                failed += 1
+                self.stderr.write(f"{student.matric_number}: expected exactly one face on enrollment image")
+                continue
+
+            student.set_face_encoding(encoding)
+            student.save(update_fields=["encoding"])
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Encoded {done} students, {failed} failed"))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from server_app.models import XSession
+
+
+class Command(BaseCommand):
+    help = "Delete expired login sessions in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000,
+            help="Sessions deleted per statement, keeps each lock short")
+        parser.add_argument(
+            "--pause", type=float, default=0.0,
+            help="Seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+
+        while True:
+            batch = list(XSession.objects.filter(
+                expires__lte=now).order_by('expires').values_list('pk', flat=True)[:options["batch_size"]])
+            if not batch:
+                break
+
+            XSession.objects.filter(pk__in=batch).delete()
+            total += len(batch)
+
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(f"Deleted {total} expired sessions")
@@ -0,0 +1,34 @@
+import csv
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from server_app.enrollment import enroll_archive
+
+
+class Command(BaseCommand):
+    help = "Enroll students from a zip archive of images and a CSV with matric_number and image columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Zip archive of enrollment images")
+        parser.add_argument("students", help="CSV file with matric_number and image columns")
+        parser.add_argument("--report", help="Write the per-row report to this CSV file")
+
+    def handle(self, *args, **options):
+        try:
+            report = enroll_archive(options["archive"], options["students"])
+        except (OSError, zipfile.BadZipFile) as error:
+            raise CommandError(str(error))
+
+        failed = [entry for entry in report if entry["status"] == "FAILED"]
+        for entry in failed:
+            self.stderr.write(f'row {entry["row"]} {entry["matric_number"]}: {entry["message"]}')
+
+        if options["report"]:
+            with open(options["report"], "w", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=["row", "matric_number", "status", "message"])
+                writer.writeheader()
+                writer.writerows(report)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Enrolled {len(report) - len(failed)} students, {len(failed)} failed"))
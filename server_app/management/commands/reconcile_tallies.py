@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from server_app import tallies
+from server_app.models import Course
+
+
+class Command(BaseCommand):
+    help = "Recount the attendance counters of every course and fix any that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, action="append",
+            help="Only reconcile this course id, can be given more than once")
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by('pk')
+        if options["course"]:
+            courses = courses.filter(pk__in=options["course"])
+
+        total = 0
+        for course in courses.iterator():
+            fixed = tallies.reconcile(course)
+            if fixed:
+                self.stdout.write(f"{course.pk} {course.code}: fixed {fixed} counters")
+            total += fixed
+
+        self.stdout.write(f"Fixed {total} counters")
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from server_app import jobs
+from server_app.models import AttendanceJob
+
+
+class Command(BaseCommand):
+    help = "Verify pending attendance submissions queued with attend?async=1, and retry ones left running by a dead worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep polling for new submissions instead of exiting when the queue is empty")
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Seconds to sleep between polls when --loop is set")
+
+    def handle(self, *args, **options):
+        while True:
+            reclaimed = jobs.reclaim()
+            if reclaimed:
+                self.stdout.write(f"Reclaimed {reclaimed} stalled jobs")
+
+            pending = list(AttendanceJob.objects.filter(
+                status='PENDING').order_by('created').values_list('pk', flat=True)[:100])
+
+            for job_id in pending:
+                job = jobs.run(job_id)
+                if job is not None:
+                    self.stdout.write(f"{job.pk} {job.status} {job.message}")
+
+            if not options["loop"]:
+                break
+            if not pending:
+                time.sleep(options["interval"])
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from server_app import live, tallies
+from server_app.models import Student, StudentAttendance
+
+
+def claim_timeout():
+    return getattr(settings, "ATTENDANCE_CLAIM_TIMEOUT", 60)
+
+
+def _key(student_id, attendance_id):
+    return f"attendance-claim:{attendance_id}:{student_id}"
+
+
+def claim(student_id, attendance_id):
+    """Marks a submission for this student and session as in flight.
+
+    False when another one already is, so a retry does not run the face
+    check a second time. The claim lives in the default cache, shared
+    between processes when that cache is, and expires after
+    ATTENDANCE_CLAIM_TIMEOUT seconds if it is never released.
+    """
+    return cache.add(_key(student_id, attendance_id), 1, claim_timeout())
+
+
+def release(student_id, attendance_id):
+    cache.delete(_key(student_id, attendance_id))
+
+
+def insert(student_attendance):
+    """Saves a new entry, False when the student is already on the list.
+
+    The unique (student, attendance) constraint decides, so two submissions
+    that both passed the existence check cannot both be stored. The caller
+    cleans up the image of a rejected entry.
+    """
+    try:
+        with transaction.atomic():
+            student_attendance.save()
+            tallies.record([student_attendance])
+            announce([student_attendance])
+    except IntegrityError:
+        return False
+    return True
+
+
+def insert_many(student_attendances):
+    """Bulk inserts new entries and returns the ones that were stored.
+
+    When one of the students was put on the list meanwhile the batch is
+    retried a row at a time and that row is left out.
+    """
+    if not student_attendances:
+        return []
+
+    try:
+        with transaction.atomic():
+            StudentAttendance.objects.bulk_create(student_attendances)
+            tallies.record(student_attendances)
+            announce(student_attendances)
+        return student_attendances
+    except IntegrityError:
+        return [student_attendance for student_attendance in student_attendances if insert(student_attendance)]
+
+
+def announce(student_attendances):
+    # lecturers watching the session hear about it once the insert commits
+    matric_numbers = {}
+    missing = set()
+    for student_attendance in student_attendances:
+        if StudentAttendance.student.is_cached(student_attendance):
+            matric_numbers[student_attendance.student_id] = student_attendance.student.matric_number
+        else:
+            missing.add(student_attendance.student_id)
+    if missing:
+        matric_numbers.update(Student.objects.filter(pk__in=missing).values_list('pk', 'matric_number'))
+
+    live.publish_marked(student_attendances, matric_numbers)
@@ -0,0 +1,91 @@
+# Generated by Django 4.0 on 2026-10-18 16:08
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datetime', models.DateTimeField(auto_now=True)),
+                ('lat', models.CharField(max_length=100)),
+                ('long', models.CharField(max_length=100)),
+                ('code', models.CharField(max_length=10)),
+                ('is_open', models.BooleanField(default=True)),
+                ('commit', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Student',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matric_number', models.CharField(max_length=100)),
+                ('image', models.FileField(max_length=200, upload_to='students_images')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_type', models.CharField(max_length=20)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='XSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session', models.CharField(max_length=100)),
+                ('expires', models.DateTimeField(default=datetime.datetime.now)),
+                ('user_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.usertype')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StudentAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datetime', models.DateTimeField(auto_created=True, null=True)),
+                ('lat', models.CharField(max_length=100, null=True)),
+                ('long', models.CharField(max_length=100, null=True)),
+                ('score', models.IntegerField(default=-1)),
+                ('distance', models.FloatField(default=-1, null=True)),
+                ('attendance_image', models.FileField(max_length=250, upload_to='attendance_image')),
+                ('commit', models.BooleanField(default=False)),
+                ('attendance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.attendance')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.student')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Lecturer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(max_length=200)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Course',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=120)),
+                ('code', models.CharField(max_length=120)),
+                ('lecturer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.lecturer')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.course'),
+        ),
+    ]
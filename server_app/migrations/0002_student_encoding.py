@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 16:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='encoding',
+            field=models.BinaryField(null=True),
+        ),
+    ]
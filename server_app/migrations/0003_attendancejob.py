@@ -0,0 +1,31 @@
+# Generated by Django 4.0 on 2026-10-18 16:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0002_student_encoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('image', models.FileField(max_length=250, upload_to='attendance_image')),
+                ('lat', models.CharField(max_length=100, null=True)),
+                ('long', models.CharField(max_length=100, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('RUNNING', 'RUNNING'), ('ACCEPTED', 'ACCEPTED'), ('REJECTED', 'REJECTED')], default='PENDING', max_length=20)),
+                ('message', models.CharField(blank=True, default='', max_length=250)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(null=True)),
+                ('attendance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.attendance')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.student')),
+                ('student_attendance', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='server_app.studentattendance')),
+            ],
+        ),
+    ]
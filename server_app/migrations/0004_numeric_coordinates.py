@@ -0,0 +1,70 @@
+import math
+
+from django.db import migrations, models
+
+MODELS = ('attendance', 'studentattendance', 'attendancejob')
+
+
+def parse_position(lat, long):
+    try:
+        lat, long = float(lat), float(long)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(lat) or math.isnan(long) or abs(lat) > 90 or abs(long) > 180:
+        return None
+    return lat, long
+
+
+def convert_coordinates(apps, schema_editor):
+    # unparseable or out of range positions become null, which skips the geofence
+    for model_name in MODELS:
+        Model = apps.get_model('server_app', model_name)
+        rows = []
+        for row in Model.objects.only('pk', 'lat', 'long').iterator(chunk_size=2000):
+            position = parse_position(row.lat, row.long)
+            if position is not None:
+                row.lat_value, row.long_value = position
+                rows.append(row)
+            if len(rows) >= 2000:
+                Model.objects.bulk_update(rows, ['lat_value', 'long_value'])
+                rows = []
+        Model.objects.bulk_update(rows, ['lat_value', 'long_value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0003_attendancejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='radius',
+            field=models.FloatField(default=100),
+        ),
+    ]
+
+    for model_name in MODELS:
+        operations += [
+            migrations.AddField(
+                model_name=model_name,
+                name='lat_value',
+                field=models.FloatField(null=True),
+            ),
+            migrations.AddField(
+                model_name=model_name,
+                name='long_value',
+                field=models.FloatField(null=True),
+            ),
+        ]
+
+    operations.append(migrations.RunPython(convert_coordinates, migrations.RunPython.noop))
+
+    for model_name in MODELS:
+        operations += [
+            migrations.RemoveField(model_name=model_name, name='lat'),
+            migrations.RemoveField(model_name=model_name, name='long'),
+            migrations.RenameField(model_name=model_name, old_name='lat_value', new_name='lat'),
+            migrations.RenameField(model_name=model_name, old_name='long_value', new_name='long'),
+        ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+import datetime
+
+
+def drop_duplicate_sessions(apps, schema_editor):
+    XSession = apps.get_model('server_app', 'XSession')
+
+    duplicates = XSession.objects.values('session').annotate(
+        count=models.Count('pk')).filter(count__gt=1).values_list('session', flat=True)
+    for session in duplicates:
+        # nobody can tell which user a shared token belongs to, drop them all
+        XSession.objects.filter(session=session).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0004_numeric_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='xsession',
+            name='session',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='xsession',
+            name='expires',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime.now),
+        ),
+    ]
@@ -0,0 +1,79 @@
+import random
+import string
+
+from django.db import migrations, models
+
+CODE_CHARS = string.ascii_uppercase + string.digits
+
+
+def normalize_codes(apps, schema_editor):
+    Attendance = apps.get_model('server_app', 'Attendance')
+
+    rows = []
+    for attendance in Attendance.objects.only('pk', 'code').iterator(chunk_size=2000):
+        code = str(attendance.code).strip().upper()
+        if code != attendance.code:
+            attendance.code = code
+            rows.append(attendance)
+    Attendance.objects.bulk_update(rows, ['code'], batch_size=2000)
+
+    # only one uncommitted session may hold a code, older ones get a fresh one
+    open_sessions = Attendance.objects.filter(commit=False)
+    taken = set(open_sessions.values_list('code', flat=True))
+    duplicates = open_sessions.values('code').annotate(
+        count=models.Count('pk')).filter(count__gt=1).values_list('code', flat=True)
+    for code in list(duplicates):
+        for attendance in open_sessions.filter(code=code).order_by('-pk')[1:]:
+            new_code = code
+            while new_code in taken:
+                new_code = ''.join(random.choice(CODE_CHARS) for _ in range(6))
+            taken.add(new_code)
+            attendance.code = new_code
+            attendance.save(update_fields=['code'])
+
+
+def merge_students(apps, schema_editor):
+    Student = apps.get_model('server_app', 'Student')
+    StudentAttendance = apps.get_model('server_app', 'StudentAttendance')
+    AttendanceJob = apps.get_model('server_app', 'AttendanceJob')
+
+    duplicates = Student.objects.values('matric_number').annotate(
+        count=models.Count('pk')).filter(count__gt=1).values_list('matric_number', flat=True)
+    for matric_number in list(duplicates):
+        # keep the oldest enrollment that has a face encoding
+        students = list(Student.objects.filter(matric_number=matric_number).order_by('pk'))
+        keep = next((student for student in students if student.encoding), students[0])
+        others = [student.pk for student in students if student.pk != keep.pk]
+
+        StudentAttendance.objects.filter(student_id__in=others).update(student_id=keep.pk)
+        AttendanceJob.objects.filter(student_id__in=others).update(student_id=keep.pk)
+        Student.objects.filter(pk__in=others).delete()
+
+
+def merge_student_attendances(apps, schema_editor):
+    StudentAttendance = apps.get_model('server_app', 'StudentAttendance')
+    AttendanceJob = apps.get_model('server_app', 'AttendanceJob')
+
+    duplicates = StudentAttendance.objects.values('student_id', 'attendance_id').annotate(
+        count=models.Count('pk')).filter(count__gt=1).values_list('student_id', 'attendance_id')
+    for student_id, attendance_id in list(duplicates):
+        # a committed entry wins over an uncommitted one, then the earliest
+        rows = list(StudentAttendance.objects.filter(
+            student_id=student_id, attendance_id=attendance_id).order_by('-commit', 'pk').values_list('pk', flat=True))
+        keep, others = rows[0], rows[1:]
+
+        AttendanceJob.objects.filter(student_attendance_id__in=others).update(student_attendance_id=keep)
+        StudentAttendance.objects.filter(pk__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0005_xsession_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_codes, migrations.RunPython.noop),
+        migrations.RunPython(merge_students, migrations.RunPython.noop),
+        migrations.RunPython(merge_student_attendances, migrations.RunPython.noop),
+    ]
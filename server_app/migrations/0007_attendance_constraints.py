@@ -0,0 +1,31 @@
+# Generated by Django 4.0 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0006_deduplicate_attendance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='code',
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='student',
+            name='matric_number',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(condition=models.Q(('commit', False)), fields=('code',), name='unique_uncommitted_attendance_code'),
+        ),
+        migrations.AddConstraint(
+            model_name='studentattendance',
+            constraint=models.UniqueConstraint(fields=('student', 'attendance'), name='unique_student_attendance'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0007_attendance_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
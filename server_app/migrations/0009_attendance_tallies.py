@@ -0,0 +1,69 @@
+# Generated by Django 4.0 on 2026-10-18 16:30
+
+from django.db import migrations, models
+import django.db.models.functions
+import django.db.models.deletion
+
+
+def count_rows(apps, schema_editor):
+    Attendance = apps.get_model('server_app', 'Attendance')
+    Course = apps.get_model('server_app', 'Course')
+    CourseStudentTally = apps.get_model('server_app', 'CourseStudentTally')
+    StudentAttendance = apps.get_model('server_app', 'StudentAttendance')
+
+    entries = StudentAttendance.objects.filter(attendance=models.OuterRef('pk')).order_by().values('attendance')
+    Attendance.objects.update(
+        present_count=models.functions.Coalesce(
+            models.Subquery(entries.annotate(count=models.Count('pk')).values('count')), 0),
+        committed_count=models.functions.Coalesce(
+            models.Subquery(entries.filter(commit=True).annotate(count=models.Count('pk')).values('count')), 0))
+
+    sessions = Attendance.objects.filter(course=models.OuterRef('pk')).order_by().values('course')
+    Course.objects.update(session_count=models.functions.Coalesce(
+        models.Subquery(sessions.annotate(count=models.Count('pk')).values('count')), 0))
+
+    tallies = StudentAttendance.objects.values('attendance__course_id', 'student_id').annotate(
+        present=models.Count('pk')).order_by()
+    CourseStudentTally.objects.bulk_create([
+        CourseStudentTally(course_id=row['attendance__course_id'], student_id=row['student_id'], present=row['present'])
+        for row in tallies.iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0008_course_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='committed_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='present_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='session_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='CourseStudentTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('present', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='server_app.student')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='coursestudenttally',
+            constraint=models.UniqueConstraint(fields=('course', 'student'), name='unique_course_student_tally'),
+        ),
+        migrations.RunPython(count_rows, migrations.RunPython.noop),
+    ]
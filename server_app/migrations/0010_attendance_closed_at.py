@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0009_attendance_tallies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
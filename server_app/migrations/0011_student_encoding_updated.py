@@ -0,0 +1,25 @@
+# Generated by Django 4.0 on 2026-10-18 16:42
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def stamp_encodings(apps, schema_editor):
+    Student = apps.get_model('server_app', 'Student')
+    Student.objects.filter(encoding__isnull=False).update(encoding_updated=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0010_attendance_closed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='encoding_updated',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(stamp_encodings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0 on 2026-10-18 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0011_student_encoding_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancejob',
+            name='started',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
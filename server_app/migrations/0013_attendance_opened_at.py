@@ -0,0 +1,32 @@
+# Generated by Django 4.0 on 2026-10-18 16:56
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Least
+
+
+def set_opened_at(apps, schema_editor):
+    # datetime is the last save, a session's first entry may be older than that
+    Attendance = apps.get_model('server_app', 'Attendance')
+    StudentAttendance = apps.get_model('server_app', 'StudentAttendance')
+
+    first_entry = StudentAttendance.objects.filter(
+        attendance=models.OuterRef('pk'), datetime__isnull=False
+    ).order_by('datetime').values('datetime')[:1]
+    Attendance.objects.update(opened_at=Coalesce(
+        Least(models.F('datetime'), models.Subquery(first_entry)), models.F('datetime')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server_app', '0012_attendancejob_started'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='opened_at',
+            field=models.DateTimeField(auto_now_add=True, null=True),
+        ),
+        migrations.RunPython(set_opened_at, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.db.models.fields.related import ForeignKey
+from django.utils import timezone
 import datetime
 import random
 import string
+import uuid
+import numpy as np
 
 
 # Create your models here.
@@ -31,6 +34,21 @@ def random_id(size=12, chars=string.ascii_uppercase + string.digits):
     return ''.join(random.choice(chars) for x in range(size))
 
 
+def normalize_code(code):
+    return str(code).strip().upper()
+
+
+def pack_encoding(encoding):
+    # 128 float32 values, 512 bytes per student
+    return np.asarray(encoding, dtype=np.float32).tobytes()
+
+
+def unpack_encoding(data):
+    if not data:
+        return None
+    return np.frombuffer(bytes(data), dtype=np.float32).astype(np.float64)
+
+
 class UserType ( models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     user_type = models.CharField(max_length=20)
@@ -40,8 +58,8 @@ class UserType ( models.Model):
 
 class XSession (models.Model):
     user_type = models.ForeignKey(UserType, on_delete=models.CASCADE )
-    session = models.CharField(max_length=100)
-    expires = models.DateTimeField(default=datetime.datetime.now)
+    session = models.CharField(max_length=100, unique=True)
+    expires = models.DateTimeField(default=datetime.datetime.now, db_index=True)
 
 class Lecturer (models.Model):
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
@@ -50,33 +68,103 @@ class Lecturer (models.Model):
     def __str__(self):
         return f'{self.email}'
 
-class Course(models.Model):
+class CounterFields:
+    """For models with counters that only move through F() updates. A plain
+    save() of an existing row leaves them out, so it cannot write back a
+    stale copy over concurrent increments."""
+    counters = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counters
+            ]
+        super().save(*args, **kwargs)
+
+
+class CourseQuerySet(models.QuerySet):
+    def listing(self):
+        # everything CourseSerializer reads, in one query
+        return self.select_related('lecturer')
+
+
+class Course(CounterFields, models.Model):
     title = models.CharField(max_length=120)
     code =  models.CharField(max_length=120)
     lecturer = models.ForeignKey(Lecturer, on_delete=models.CASCADE)
+    # advanced on every change to the course's sessions or entries, cached
+    # exports are keyed by it
+    version = models.PositiveIntegerField(default=0, editable=False)
+    session_count = models.IntegerField(default=0, editable=False)
+
+    objects = CourseQuerySet.as_manager()
+
+    counters = ('version', 'session_count')
+
+    @staticmethod
+    def touch(course_id=None, attendance_id=None):
+        courses = Course.objects.filter(pk=course_id) if course_id else Course.objects.filter(attendance=attendance_id)
+        courses.update(version=models.F('version') + 1)
 
     def attendances(self):
-        queries = Attendance.objects.filter(course = self)
-        return len(queries)
+        return self.session_count
 
     def __str__(self):
         return f' {self.title} For {str(self.lecturer)} '
-class Attendance(models.Model):
+class AttendanceQuerySet(models.QuerySet):
+    def by_code(self, code):
+        """Sessions with this code, the one still taking submissions first.
+
+        Codes are stored upper case and only unique among uncommitted
+        sessions, a committed session may share its code with later ones.
+        """
+        if not code:
+            return self.none()
+        return self.filter(code=normalize_code(code)).order_by('commit', '-pk')
+
+    def listing(self):
+        # everything AttendanceSerializer reads, in one query
+        return self.select_related('course')
+
+
+class Attendance(CounterFields, models.Model):
     course = models.ForeignKey(Course,on_delete=models.CASCADE)
     datetime = models.DateTimeField(auto_now=True)
-    lat = models.CharField(max_length=100)
-    long = models.CharField(max_length=100)
-    code = models.CharField(max_length=10)
+    lat = models.FloatField(null=True)
+    long = models.FloatField(null=True)
+    # metres from lat/long that a submission may be, 0 turns the check off
+    radius = models.FloatField(default=100)
+    code = models.CharField(max_length=10, db_index=True)
     is_open = models.BooleanField(default=True)
     commit = models.BooleanField(default=False)
+    # datetime moves on every save, opened_at is when the session was created
+    opened_at = models.DateTimeField(auto_now_add=True, null=True)
+    # when the lecturer closed the list, queued captures taken before it are still synced
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # entries on the list and how many of them are committed, see server_app.tallies
+    present_count = models.IntegerField(default=0, editable=False)
+    committed_count = models.IntegerField(default=0, editable=False)
+
+    objects = AttendanceQuerySet.as_manager()
+
+    counters = ('present_count', 'committed_count')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['code'], condition=models.Q(commit=False), name='unique_uncommitted_attendance_code'),
+        ]
 
     def __str__(self):
         return f"{self.date()} {str(self.course)} ({self.code})"
 
-    def attendances(self):
-        attendances = StudentAttendance.objects.filter(attendance = self).count()
+    def save(self, *args, **kwargs):
+        self.code = normalize_code(self.code)
+        super().save(*args, **kwargs)
 
-        return attendances
+    def attendances(self):
+        return self.present_count
     
     def date(self):
         return convertDatetimeToString(self.datetime, True)
@@ -87,23 +175,51 @@ class Attendance(models.Model):
         return self.course.code
         
 class Student(models.Model):
-    matric_number = models.CharField(max_length=100)
+    matric_number = models.CharField(max_length=100, unique=True)
     image = models.FileField(max_length=200, upload_to="students_images")
+    encoding = models.BinaryField(null=True, editable=False)
+    # when encoding was last written, other processes' face indexes refresh from it
+    encoding_updated = models.DateTimeField(null=True, editable=False, db_index=True)
 
     def __str__(self):
         return f"{self.matric_number}"
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'encoding' in update_fields and 'encoding_updated' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['encoding_updated']
+        super().save(*args, **kwargs)
+
+    def face_encoding(self):
+        return unpack_encoding(self.encoding)
+
+    def set_face_encoding(self, encoding):
+        self.encoding = pack_encoding(encoding)
+        self.encoding_updated = timezone.now()
+
+class StudentAttendanceQuerySet(models.QuerySet):
+    def listing(self):
+        return self.select_related('student')
+
+
 class StudentAttendance(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE)
-    lat = models.CharField(max_length=100, null=True)
-    long = models.CharField(max_length=100, null=True)
+    lat = models.FloatField(null=True)
+    long = models.FloatField(null=True)
     score = models.IntegerField( default=-1)
     distance = models.FloatField(default=-1, null=True)
     attendance_image = models.FileField(max_length=250, upload_to="attendance_image")
     commit = models.BooleanField(default=False)
     datetime = models.DateTimeField( auto_created=True,null=True)
 
+    objects = StudentAttendanceQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'attendance'], name='unique_student_attendance'),
+        ]
+
     def __str__(self):
         return f"{str(self.attendance)} / {str(self.student)} "
 
@@ -111,4 +227,52 @@ class StudentAttendance(models.Model):
         return self.student.matric_number
 
     def date(self):
-        return convertDatetimeToString(self.datetime, True)
\ No newline at end of file
+        return convertDatetimeToString(self.datetime, True)
+
+class CourseStudentTally(models.Model):
+    """How many sessions of a course a student is on the list for."""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    present = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'student'], name='unique_course_student_tally'),
+        ]
+
+    def __str__(self):
+        return f"{str(self.course)} / {str(self.student)} ({self.present})"
+
+JOB_STATUSES = (
+    ('PENDING', 'PENDING'),
+    ('RUNNING', 'RUNNING'),
+    ('ACCEPTED', 'ACCEPTED'),
+    ('REJECTED', 'REJECTED'),
+)
+
+
+class AttendanceJob(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE)
+    image = models.FileField(max_length=250, upload_to="attendance_image")
+    lat = models.FloatField(null=True)
+    long = models.FloatField(null=True)
+    status = models.CharField(max_length=20, choices=JOB_STATUSES, default='PENDING')
+    message = models.CharField(max_length=250, blank=True, default='')
+    student_attendance = models.ForeignKey(StudentAttendance, on_delete=models.SET_NULL, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # when a worker claimed it, a RUNNING job started long ago lost its worker
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{str(self.attendance)} / {str(self.student)} ({self.status})"
+
+    def is_done(self):
+        return self.status in ('ACCEPTED', 'REJECTED')
+
+    def datetime(self):
+        if self.student_attendance is None:
+            return None
+        return self.student_attendance.datetime
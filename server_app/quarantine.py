@@ -0,0 +1,55 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+
+def enabled():
+    return bool(getattr(settings, "FACE_QUARANTINE_DIR", None))
+
+
+def store(data, name, matric_number, reason):
+    """Keeps a rejected upload for review, when FACE_QUARANTINE_DIR is set."""
+    if not enabled():
+        return None
+
+    directory = settings.FACE_QUARANTINE_DIR
+    extension = os.path.splitext(name or "")[1] or ".jpg"
+    filename = f"{time.time_ns()}-{slugify(matric_number)}-{slugify(reason)[:40]}{extension}"
+    path = os.path.join(directory, filename)
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+        evict(directory, getattr(settings, "FACE_QUARANTINE_MAX_BYTES", 500 * 1024 * 1024))
+    except OSError:
+        logger.exception("Could not quarantine rejected upload %s", filename)
+        return None
+
+    return path
+
+
+def evict(directory, max_bytes):
+    with _lock:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+        total = sum(entry.stat().st_size for entry in entries)
+        if total <= max_bytes:
+            return
+
+        # names start with the capture time in ns, so sorting by name is oldest first
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            if total <= max_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,126 @@
+import threading
+import time
+
+from django.conf import settings
+
+from server_app.models import Attendance, Student, normalize_code
+
+_lock = threading.Lock()
+_rosters = {}
+
+
+def ttl():
+    return getattr(settings, "ATTENDANCE_ROSTER_TTL", 15 * 60)
+
+
+def state_ttl():
+    return getattr(settings, "ATTENDANCE_ROSTER_STATE_TTL", 30)
+
+
+class Roster:
+    """What attend needs for one open session, kept in memory while it is open.
+
+    Holds the session state (flags, location and radius) and the enrollment
+    encodings of the students expected in the course, so a submission costs
+    no Attendance or Student query. The state is re-read at most every ATTENDANCE_ROSTER_STATE_TTL
+    seconds, which bounds how long another process can miss a close.
+    """
+
+    def __init__(self, attendance, students):
+        self.attendance_id = attendance.pk
+        self.course_id = attendance.course_id
+        self.code = normalize_code(attendance.code)
+        self.set_state(
+            attendance.is_open, attendance.commit, attendance.lat, attendance.long, attendance.radius)
+        self.students = {}
+        for student_id, matric_number, encoding in students:
+            self.add(student_id, matric_number, encoding)
+        self.expires = time.monotonic() + ttl()
+
+    def set_state(self, is_open, commit, lat, long, radius):
+        self.is_open = is_open
+        self.commit = commit
+        self.lat = lat
+        self.long = long
+        self.radius = radius
+        self.checked = time.monotonic()
+
+    def refresh_state(self):
+        if time.monotonic() - self.checked < state_ttl():
+            return True
+
+        state = Attendance.objects.filter(pk=self.attendance_id).values(
+            'is_open', 'commit', 'lat', 'long', 'radius').first()
+        if state is None:
+            return False
+
+        self.set_state(**state)
+        return True
+
+    def add(self, student_id, matric_number, encoding):
+        if encoding:
+            self.students[matric_number] = (student_id, bytes(encoding))
+
+    def attendance(self):
+        return Attendance(
+            pk=self.attendance_id, course_id=self.course_id, code=self.code,
+            is_open=self.is_open, commit=self.commit, lat=self.lat, long=self.long,
+            radius=self.radius)
+
+    def student(self, matric_number):
+        cached = self.students.get(matric_number)
+        if cached is None:
+            return None
+
+        student_id, encoding = cached
+        return Student(pk=student_id, matric_number=matric_number, encoding=encoding)
+
+
+def expected_students(course_id):
+    # students who have attended this course before
+    return Student.objects.filter(
+        studentattendance__attendance__course_id=course_id,
+        encoding__isnull=False
+    ).distinct().values_list('pk', 'matric_number', 'encoding')
+
+
+def warm(attendance):
+    """Preloads the roster of a session that has just been opened."""
+    if not attendance.is_open or attendance.commit:
+        invalidate(attendance.code)
+        return None
+
+    roster = Roster(attendance, expected_students(attendance.course_id))
+
+    with _lock:
+        _evict()
+        _rosters[roster.code] = roster
+    return roster
+
+
+def get(code):
+    if not code:
+        return None
+
+    code = normalize_code(code)
+    with _lock:
+        roster = _rosters.get(code)
+        if roster is not None and roster.expires < time.monotonic():
+            del _rosters[code]
+            roster = None
+
+    if roster is not None and not roster.refresh_state():
+        invalidate(code)
+        return None
+    return roster
+
+
+def invalidate(code):
+    with _lock:
+        _rosters.pop(normalize_code(code), None)
+
+
+def _evict():
+    now = time.monotonic()
+    for code in [code for code, roster in _rosters.items() if roster.expires < now]:
+        del _rosters[code]
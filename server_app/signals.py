@@ -0,0 +1,97 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from server_app import face_index, tallies
+from server_app.models import Attendance, Course, Lecturer, Student, StudentAttendance, UserType, XSession
+from server_app.verify import sessions
+
+# sessions being deleted by this thread, their entries' cascade is counted in bulk
+_deleting = threading.local()
+
+
+def deleting_sessions():
+    if not hasattr(_deleting, "ids"):
+        _deleting.ids = set()
+    return _deleting.ids
+
+
+@receiver(post_save, sender=Student)
+def index_student(sender, instance, **kwargs):
+    index = face_index.loaded()
+    if index is None:
+        return
+
+    encoding = instance.face_encoding()
+    if encoding is None:
+        index.remove(instance.pk)
+    else:
+        index.add(instance.pk, encoding)
+
+
+@receiver(post_delete, sender=Student)
+def unindex_student(sender, instance, **kwargs):
+    index = face_index.loaded()
+    if index is not None:
+        index.remove(instance.pk)
+
+
+@receiver(post_delete, sender=XSession)
+def forget_session(sender, instance, **kwargs):
+    sessions.forget(instance.session)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_sessions(sender, instance, **kwargs):
+    # a deactivated or changed user must not keep authenticating from the cache
+    sessions.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=UserType)
+@receiver(post_delete, sender=UserType)
+@receiver(post_save, sender=Lecturer)
+@receiver(post_delete, sender=Lecturer)
+def forget_principal(sender, instance, **kwargs):
+    # cached sessions carry the role and lecturer row
+    sessions.forget_user(instance.user_id)
+
+
+@receiver(post_save, sender=Attendance)
+def touch_course(sender, instance, created=False, **kwargs):
+    if created:
+        tallies.session_added(instance.course_id)
+    Course.touch(course_id=instance.course_id)
+
+
+@receiver(pre_delete, sender=Attendance)
+def removing_session(sender, instance, **kwargs):
+    # runs before the cascade deletes the entries
+    tallies.session_deleted(instance)
+    deleting_sessions().add(instance.pk)
+
+
+@receiver(post_delete, sender=Attendance)
+def remove_session(sender, instance, **kwargs):
+    deleting_sessions().discard(instance.pk)
+    tallies.session_added(instance.course_id, -1)
+    Course.touch(course_id=instance.course_id)
+
+
+@receiver(post_save, sender=StudentAttendance)
+def touch_attendance_course(sender, instance, **kwargs):
+    # bulk_create sends no post_save, its callers touch the course themselves.
+    # Inserts are counted by server_app.marking.
+    Course.touch(attendance_id=instance.attendance_id)
+
+
+@receiver(post_delete, sender=StudentAttendance)
+def remove_student_attendance(sender, instance, **kwargs):
+    if instance.attendance_id in deleting_sessions():
+        return
+
+    course_id = Attendance.objects.filter(pk=instance.attendance_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        tallies.forget(instance, course_id)
+        Course.touch(course_id=course_id)
@@ -0,0 +1,178 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from server_app import face_engine, marking
+from server_app.models import Attendance, Course, Student, StudentAttendance, normalize_code
+from server_app.geo import check_position, parse_position
+from server_app.verification import check_face
+
+
+def parse_captured_at(value):
+    try:
+        captured = parse_datetime(str(value)) if value else None
+    except ValueError:
+        return None
+    if captured is not None and timezone.is_naive(captured):
+        captured = timezone.make_aware(captured)
+    return captured
+
+
+def captured_at(value):
+    captured = parse_captured_at(value)
+    if captured is None:
+        return timezone.now()
+    return min(captured, timezone.now())
+
+
+def captured_before_opening(attendance, value):
+    # nothing can have been captured for a session before it existed
+    captured = parse_captured_at(value)
+    return captured is not None and attendance.opened_at is not None and captured < attendance.opened_at
+
+
+def captured_while_open(attendance, value):
+    """A closed session only takes captures known to predate its closing,
+    a missing or later captured_at is not trusted."""
+    captured = parse_captured_at(value)
+    return (
+        captured is not None and attendance.closed_at is not None
+        and captured <= min(attendance.closed_at, timezone.now())
+    )
+
+
+def read(image):
+    # two queued items may point at the same part
+    image.seek(0)
+    return image.read()
+
+
+def result(item, item_status, message="", datetime=None):
+    return {
+        "id": item.get("id"),
+        "status": item_status,
+        "message": message,
+        "datetime": datetime
+    }
+
+
+def sync_submissions(items, files):
+    """Verifies a batch of queued attend submissions and stores the accepted ones.
+
+    Codes, students and existing entries are resolved with one query each,
+    the images are analysed in parallel on the face engine and the accepted
+    rows are bulk inserted with the time they were captured.
+    Returns one result per item, in order.
+    """
+    results = [None] * len(items)
+    candidates = []
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[position] = result({}, "REJECTED", "Invalid submission")
+            continue
+
+        image = files.get(item.get("image") or "")
+        location = parse_position(item.get("lat"), item.get("long"))
+        if not item.get("attendance_code") or not item.get("matric_number"):
+            results[position] = result(item, "REJECTED", "Please provide the attendance code and matric number")
+        elif location is None:
+            results[position] = result(item, "REJECTED", "Sorry could not determine your position")
+        elif image is None:
+            results[position] = result(item, "REJECTED", "Please Capture an image showing your face")
+        else:
+            candidates.append((position, item, image, location))
+
+    codes = {normalize_code(item["attendance_code"]) for _, item, _, _ in candidates}
+    attendances = {}
+    for attendance in Attendance.objects.filter(code__in=codes).order_by('-commit', 'pk'):
+        # the session still taking submissions wins, as with Attendance.objects.by_code
+        attendances[attendance.code] = attendance
+
+    students = {
+        student.matric_number: student
+        for student in Student.objects.filter(
+            matric_number__in={item["matric_number"] for _, item, _, _ in candidates})
+    }
+
+    existing = set(StudentAttendance.objects.filter(
+        attendance__in=attendances.values(), student__in=students.values()
+    ).values_list('student_id', 'attendance_id'))
+
+    pending = []
+    for position, item, image, location in candidates:
+        attendance = attendances.get(normalize_code(item["attendance_code"]))
+        student = students.get(item["matric_number"])
+
+        message = None
+        distance = None
+        if attendance is None:
+            message = "No attendance list was found, make sure you provide a valid attendance code"
+        elif attendance.commit:
+            message = "Attendance list already submitted"
+        elif captured_before_opening(attendance, item.get("captured_at")):
+            message = "This capture was taken before the attendance list was opened"
+        elif not attendance.is_open and not captured_while_open(attendance, item.get("captured_at")):
+            # a closed session still takes captures queued before it closed, until it is committed
+            message = "Attendance list found but is not open"
+        elif student is None:
+            message = "This student is not enrolled yet"
+        elif (student.pk, attendance.pk) in existing:
+            message = "This student is already on the list"
+        else:
+            distance, message = check_position(attendance, *location)
+
+        if message:
+            results[position] = result(item, "REJECTED", message)
+            continue
+
+        pending.append((position, item, image, attendance, student, location, distance))
+
+    contents = [read(image) for _, _, image, _, _, _, _ in pending]
+    analyses = face_engine.analyse_many(contents)
+
+    image_field = StudentAttendance._meta.get_field('attendance_image')
+    rows = []
+    for (position, item, image, attendance, student, location, distance), data, analysis in zip(
+            pending, contents, analyses):
+        if isinstance(analysis, face_engine.EngineTimeout):
+            message = "Sorry your image could not be checked right now, please try again"
+        elif isinstance(analysis, Exception):
+            message = "Sorry your image could not be read, please capture it again"
+        elif (student.pk, attendance.pk) in existing:
+            # the same capture queued twice, the first accepted copy wins
+            message = "This student is already on the list"
+        else:
+            message = check_face(student, analysis)
+
+        if message:
+            results[position] = result(item, "REJECTED", message)
+            continue
+
+        student_attendance = StudentAttendance(
+            student=student,
+            attendance=attendance,
+            attendance_image=default_storage.save(
+                image_field.generate_filename(None, image.name), ContentFile(data)),
+            lat=location[0],
+            long=location[1],
+            distance=distance,
+            commit=True,
+            datetime=captured_at(item.get("captured_at"))
+        )
+        existing.add((student.pk, attendance.pk))
+        rows.append((position, item, student_attendance))
+
+    inserted = set(map(id, marking.insert_many([row for _, _, row in rows])))
+    for position, item, student_attendance in rows:
+        if id(student_attendance) in inserted:
+            results[position] = result(item, "ACCEPTED", datetime=student_attendance.datetime)
+        else:
+            # marked by a concurrent attend in the meantime
+            student_attendance.attendance_image.delete(save=False)
+            results[position] = result(item, "REJECTED", "This student is already on the list")
+
+    for course_id in {row.attendance.course_id for _, _, row in rows}:
+        Course.touch(course_id=course_id)
+    return results
@@ -0,0 +1,108 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from server_app.models import Attendance, Course, CourseStudentTally, StudentAttendance
+
+
+def record(entries):
+    """Counts newly inserted StudentAttendance rows into their session's
+    present and committed counts and the students' course tallies.
+
+    Every change is a single F() update, so concurrent submissions never
+    overwrite each other's counts.
+    """
+    present = Counter()
+    committed = Counter()
+    students = Counter()
+    for entry in entries:
+        present[entry.attendance_id] += 1
+        if entry.commit:
+            committed[entry.attendance_id] += 1
+        students[(entry.attendance.course_id, entry.student_id)] += 1
+
+    for attendance_id, count in present.items():
+        Attendance.objects.filter(pk=attendance_id).update(
+            present_count=F('present_count') + count,
+            committed_count=F('committed_count') + committed[attendance_id])
+
+    add_to_tallies(students)
+
+
+def forget(entry, course_id):
+    """Takes a deleted StudentAttendance row back out of the counts."""
+    Attendance.objects.filter(pk=entry.attendance_id).update(
+        present_count=F('present_count') - 1,
+        committed_count=F('committed_count') - (1 if entry.commit else 0))
+    CourseStudentTally.objects.filter(course_id=course_id, student_id=entry.student_id).update(
+        present=F('present') - 1)
+
+
+def session_deleted(attendance):
+    """Takes every entry of a session that is being deleted out of its
+    students' course tallies, in one update. A student is on a session's
+    list at most once."""
+    CourseStudentTally.objects.filter(
+        course_id=attendance.course_id,
+        student__in=StudentAttendance.objects.filter(attendance=attendance).values('student_id')
+    ).update(present=F('present') - 1)
+
+
+def add_to_tallies(students):
+    # rows for students new to the course first, then one update per increment
+    courses = defaultdict(lambda: defaultdict(list))
+    for (course_id, student_id), count in students.items():
+        courses[course_id][count].append(student_id)
+
+    for course_id, increments in courses.items():
+        student_ids = [student_id for ids in increments.values() for student_id in ids]
+        CourseStudentTally.objects.bulk_create(
+            [CourseStudentTally(course_id=course_id, student_id=student_id) for student_id in student_ids],
+            ignore_conflicts=True)
+        for count, ids in increments.items():
+            CourseStudentTally.objects.filter(course_id=course_id, student_id__in=ids).update(
+                present=F('present') + count)
+
+
+def session_added(course_id, count=1):
+    Course.objects.filter(pk=course_id).update(session_count=F('session_count') + count)
+
+
+def reconcile(course):
+    """Recounts one course's counters from its rows and fixes any that
+    drifted. Returns how many counters were corrected."""
+    fixed = 0
+
+    with transaction.atomic():
+        sessions = Attendance.objects.filter(course=course).annotate(
+            actual_present=Count('studentattendance'),
+            actual_committed=Count('studentattendance', filter=Q(studentattendance__commit=True))
+        ).exclude(present_count=F('actual_present'), committed_count=F('actual_committed'))
+        for attendance_id, present, committed in sessions.values_list('pk', 'actual_present', 'actual_committed'):
+            Attendance.objects.filter(pk=attendance_id).update(present_count=present, committed_count=committed)
+            fixed += 1
+
+        session_count = Attendance.objects.filter(course=course).count()
+        fixed += Course.objects.filter(pk=course.pk).exclude(
+            session_count=session_count).update(session_count=session_count)
+
+        actual = dict(StudentAttendance.objects.filter(attendance__course=course).values(
+            'student_id').annotate(present=Count('pk')).values_list('student_id', 'present'))
+        stored = dict(CourseStudentTally.objects.filter(course=course).values_list('student_id', 'present'))
+
+        missing = [student_id for student_id in actual if student_id not in stored]
+        CourseStudentTally.objects.bulk_create([
+            CourseStudentTally(course=course, student_id=student_id, present=actual[student_id])
+            for student_id in missing
+        ])
+        for student_id, present in stored.items():
+            # deletes leave a student's tally at 0 rather than removing it
+            if actual.get(student_id, 0) == present:
+                continue
+            CourseStudentTally.objects.filter(course=course, student_id=student_id).update(
+                present=actual.get(student_id, 0))
+            fixed += 1
+        fixed += len(missing)
+
+    return fixed
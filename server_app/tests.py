@@ -1,3 +1,437 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from server_app import codes, exports, face_index, marking
+from server_app.models import (
+    Attendance, Course, CourseStudentTally, Lecturer, Student, StudentAttendance, pack_encoding)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AttendTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        lecturer = Lecturer.objects.create(user=self.make_user("lecturer@example.com"))
+        self.course = Course.objects.create(title="Course", code="CSC101", lecturer=lecturer)
+        self.attendance = Attendance.objects.create(course=self.course, code="ABC123", lat=1, long=2)
+        self.student = Student.objects.create(matric_number="M1", image="students_images/m1.png")
+
+    def make_user(self, username):
+        return get_user_model().objects.create_user(username=username, password="password")
+
+    def attend(self, matric_number="M1", **headers):
+        return self.client.post("/api/attendance-view/attend/", {
+            "attendance_code": self.attendance.code,
+            "matric_number": matric_number,
+            "lat": 1,
+            "long": 2,
+            "image": SimpleUploadedFile("face.png", b"image"),
+        }, format="multipart", **headers)
+
+    def entry(self, student=None, attendance=None, commit=True):
+        return StudentAttendance(
+            student=student or self.student, attendance=attendance or self.attendance,
+            attendance_image="attendance_image/face.png", commit=commit)
+
+
+class FaceEngineTest(SimpleTestCase):
+
+    def test_pooled_call_keeps_dlib_out_of_the_web_process(self):
+        # a fresh interpreter, nothing else in the test run may have imported it
+        script = "\n".join([
+            "import io, sys, django",
+            "django.setup()",
+            "from django.conf import settings",
+            "settings.FACE_ENGINE_WORKERS = 1",
+            "from PIL import Image",
+            "from server_app import face_engine",
+            "image = io.BytesIO()",
+            "Image.new('RGB', (64, 64)).save(image, 'PNG')",
+            "analysis = face_engine.analyse(image.getvalue())",
+            "face_engine.shutdown()",
+            "print(type(analysis).__name__, 'face_recognition' in sys.modules)",
+        ])
+        result = subprocess.run(
+            [sys.executable, "-c", script], cwd=settings.BASE_DIR, env=os.environ.copy(),
+            capture_output=True, text=True, timeout=300)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ["Analysis", "False"])
+
+
+class FaceIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.random = np.random.default_rng(0)
+        self.encodings = {}
+        self.index = face_index.FaceIndex(capacity=2)
+
+    def add(self, *student_ids):
+        for student_id in student_ids:
+            self.encodings[student_id] = self.random.standard_normal(face_index.DIMENSION).astype(np.float32)
+            self.index.add(student_id, self.encodings[student_id])
+
+    def assertMatchesBruteForce(self):
+        queries = self.random.standard_normal((20, face_index.DIMENSION)).astype(np.float32)
+        student_ids = list(self.encodings)
+        matrix = np.array([self.encodings[student_id] for student_id in student_ids])
+
+        for query, (student_id, distance) in zip(queries, self.index.search(queries)):
+            distances = np.linalg.norm(matrix - query, axis=1)
+            self.assertEqual(student_id, student_ids[distances.argmin()])
+            self.assertAlmostEqual(distance, distances.min(), places=3)
+
+    def test_grow(self):
+        self.add(*range(1, 20))
+
+        self.assertEqual(len(self.index), 19)
+        self.assertMatchesBruteForce()
+
+    def test_add_replaces_encoding(self):
+        self.add(1, 2, 3)
+        self.add(2)
+
+        self.assertEqual(len(self.index), 3)
+        self.assertMatchesBruteForce()
+
+    def test_remove(self):
+        self.add(*range(1, 10))
+        for student_id in (1, 9, 5):
+            self.index.remove(student_id)
+            del self.encodings[student_id]
+
+        self.assertEqual(len(self.index), 6)
+        self.assertNotIn(5, self.index)
+        self.assertMatchesBruteForce()
+
+    def test_match(self):
+        self.add(1, 2)
+
+        self.assertEqual(self.index.match(self.encodings[2], 0.1), 2)
+        self.assertIsNone(self.index.match(self.encodings[2] + 1, 0.1))
+        self.assertEqual(face_index.FaceIndex().search([self.encodings[1]]), [(None, float("inf"))])
+
+
+class FaceIndexRefreshTest(TestCase):
+
+    def student(self, matric_number, encoding_updated):
+        return Student.objects.create(
+            matric_number=matric_number, image="students_images/face.png",
+            encoding=pack_encoding(np.full(face_index.DIMENSION, len(matric_number))),
+            encoding_updated=encoding_updated)
+
+    def test_refresh_rereads_the_overlap(self):
+        index = face_index.FaceIndex()
+        first = self.student("M1", timezone.now())
+        face_index.refresh(index)
+
+        # committed after the refresh by a transaction that took its timestamp before it
+        late = self.student("M22", index.refreshed_at - face_index.REFRESH_OVERLAP / 2)
+        stale = self.student("M333", index.refreshed_at - face_index.REFRESH_OVERLAP * 2)
+        face_index.refresh(index)
+
+        self.assertIn(first.pk, index)
+        self.assertIn(late.pk, index)
+        self.assertNotIn(stale.pk, index)
+
+
+@mock.patch("server_app.api.views.verify_face", return_value=None)
+class MarkingTest(AttendTestCase):
+
+    def test_attend_marks_student(self, verify_face):
+        response = self.attend()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["matric_number"], "M1")
+        self.assertTrue(StudentAttendance.objects.filter(student=self.student, attendance=self.attendance).exists())
+
+    def test_insert_conflict(self, verify_face):
+        self.assertTrue(marking.insert(self.entry()))
+        self.assertFalse(marking.insert(self.entry()))
+        self.assertEqual(StudentAttendance.objects.count(), 1)
+
+    def test_concurrent_insert_is_already_on_the_list(self, verify_face):
+        # another submission is stored while this one's face is being checked
+        def stored_meanwhile(student, data):
+            marking.insert(self.entry())
+            return None
+        verify_face.side_effect = stored_meanwhile
+
+        response = self.attend()
+
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(response.data["message"], "This student is already on the list")
+        self.assertEqual(StudentAttendance.objects.count(), 1)
+
+    def test_claimed_submission_conflicts(self, verify_face):
+        self.assertTrue(marking.claim(self.student.pk, self.attendance.pk))
+
+        response = self.attend()
+
+        self.assertEqual(response.status_code, 409)
+        verify_face.assert_not_called()
+
+    def test_claim_released_after_attend(self, verify_face):
+        self.attend()
+        self.assertTrue(marking.claim(self.student.pk, self.attendance.pk))
+
+
+@mock.patch("server_app.sync.check_face", return_value=None)
+@mock.patch("server_app.sync.face_engine.analyse_many", side_effect=lambda contents: [None] * len(contents))
+class SyncWindowTest(AttendTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.opened = timezone.now() - datetime.timedelta(hours=2)
+        self.closed = timezone.now() - datetime.timedelta(hours=1)
+        Attendance.objects.filter(pk=self.attendance.pk).update(opened_at=self.opened)
+
+    def close(self):
+        Attendance.objects.filter(pk=self.attendance.pk).update(is_open=False, closed_at=self.closed)
+
+    def sync(self, captured_at=None):
+        item = {"id": "1", "attendance_code": self.attendance.code, "matric_number": "M1",
+                "lat": 1, "long": 2, "image": "face"}
+        if captured_at is not None:
+            item["captured_at"] = captured_at.isoformat()
+        response = self.client.post("/api/attendance-view/sync/", {
+            "items": json.dumps([item]),
+            "face": SimpleUploadedFile("face.png", b"image"),
+        }, format="multipart")
+        return response.data["results"][0]
+
+    def test_closed_session_takes_captures_from_while_it_was_open(self, analyse_many, check_face):
+        self.close()
+        captured = self.closed - datetime.timedelta(minutes=5)
+
+        self.assertEqual(self.sync(captured)["status"], "ACCEPTED")
+        self.assertEqual(StudentAttendance.objects.get().datetime, captured)
+
+    def test_closed_session_rejects_captures_after_closing(self, analyse_many, check_face):
+        self.close()
+
+        self.assertEqual(self.sync(self.closed + datetime.timedelta(minutes=5))["status"], "REJECTED")
+        self.assertEqual(self.sync()["status"], "REJECTED")
+        self.assertFalse(StudentAttendance.objects.exists())
+
+    def test_closed_session_rejects_captures_before_opening(self, analyse_many, check_face):
+        self.close()
+
+        self.assertEqual(self.sync(self.opened - datetime.timedelta(minutes=5))["status"], "REJECTED")
+        self.assertFalse(StudentAttendance.objects.exists())
+
+    def test_open_session_rejects_captures_before_opening(self, analyse_many, check_face):
+        result = self.sync(datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+
+        self.assertEqual(result["status"], "REJECTED")
+        self.assertEqual(result["message"], "This capture was taken before the attendance list was opened")
+
+    def test_open_session_without_captured_at_is_marked_now(self, analyse_many, check_face):
+        self.assertEqual(self.sync()["status"], "ACCEPTED")
+        self.assertGreater(StudentAttendance.objects.get().datetime, self.closed)
+
+
+@mock.patch("server_app.api.views.verify_face", return_value=None)
+class IdempotencyTest(AttendTestCase):
+
+    def test_replay(self, verify_face):
+        first = self.attend(HTTP_IDEMPOTENCY_KEY="key-1")
+        second = self.attend(HTTP_IDEMPOTENCY_KEY="key-1")
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(verify_face.call_count, 1)
+        self.assertEqual(StudentAttendance.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self, verify_face):
+        Student.objects.create(matric_number="M2", image="students_images/m2.png")
+        self.attend(HTTP_IDEMPOTENCY_KEY="key-1")
+
+        response = self.attend("M2", HTTP_IDEMPOTENCY_KEY="key-1")
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(StudentAttendance.objects.filter(student__matric_number="M2").exists())
+
+    def test_rejection_is_replayed(self, verify_face):
+        verify_face.return_value = "Sorry your face did not match with the one you submitted during enrollment"
+        self.attend(HTTP_IDEMPOTENCY_KEY="key-1")
+        verify_face.return_value = None
+
+        response = self.attend(HTTP_IDEMPOTENCY_KEY="key-1")
+
+        self.assertEqual(response.status_code, 406)
+        self.assertEqual(StudentAttendance.objects.count(), 0)
+
+
+class CounterTest(AttendTestCase):
+
+    def counts(self, attendance):
+        attendance.refresh_from_db()
+        return attendance.present_count, attendance.committed_count
+
+    def tally(self, student):
+        return CourseStudentTally.objects.get(course=self.course, student=student).present
+
+    def test_insert_counts(self):
+        other = Student.objects.create(matric_number="M2", image="students_images/m2.png")
+        marking.insert(self.entry())
+        marking.insert_many([self.entry(other, commit=False)])
+
+        self.assertEqual(self.counts(self.attendance), (2, 1))
+        self.assertEqual(self.tally(self.student), 1)
+        self.assertEqual(self.tally(other), 1)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.session_count, 1)
+
+    def test_rejected_insert_is_not_counted(self):
+        marking.insert(self.entry())
+        marking.insert(self.entry())
+
+        self.assertEqual(self.counts(self.attendance), (1, 1))
+        self.assertEqual(self.tally(self.student), 1)
+
+    def test_delete_entry(self):
+        marking.insert(self.entry())
+        StudentAttendance.objects.get().delete()
+
+        self.assertEqual(self.counts(self.attendance), (0, 0))
+        self.assertEqual(self.tally(self.student), 0)
+
+    def test_delete_session(self):
+        second = Attendance.objects.create(course=self.course, code="DEF456", lat=1, long=2)
+        marking.insert_many([self.entry(), self.entry(attendance=second)])
+        self.assertEqual(self.tally(self.student), 2)
+
+        self.attendance.delete()
+
+        self.assertEqual(self.tally(self.student), 1)
+        self.assertEqual(self.counts(second), (1, 1))
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.session_count, 1)
+
+
+class CourseMatrixTest(AttendTestCase):
+
+    def test_columns_follow_sessions(self):
+        other_course = Course.objects.create(title="Other", code="CSC102", lecturer=self.course.lecturer)
+        sessions = [self.attendance]
+        for number in range(30):
+            # another course's sessions in between leave gaps in the primary keys
+            Attendance.objects.create(course=other_course, code=f"O{number}", lat=1, long=2)
+            sessions.append(Attendance.objects.create(course=self.course, code=f"S{number}", lat=1, long=2))
+        other = Student.objects.create(matric_number="M2", image="students_images/m2.png")
+
+        attended = {self.student: [0, 26, 30], other: [1, 27]}
+        marking.insert_many([
+            self.entry(student, sessions[column]) for student, columns in attended.items() for column in columns])
+
+        matrix = exports.course_matrix(self.course)
+
+        self.assertEqual([session_id for session_id, _ in matrix.sessions], [session.pk for session in sessions])
+        self.assertEqual(matrix.matric_numbers, ["M1", "M2"])
+        for row, student in enumerate(attended):
+            self.assertEqual(matrix.presence[row].nonzero()[0].tolist(), attended[student])
+
+
+class SessionCodeTest(AttendTestCase):
+
+    @mock.patch("server_app.codes.generate", side_effect=["ABC123", "DEF456"])
+    def test_collision_draws_another_code(self, generate):
+        attendance = codes.save_with_code(Attendance(course=self.course, lat=1, long=2))
+
+        self.assertEqual(attendance.code, "DEF456")
+        self.assertEqual(generate.call_count, 2)
+        self.assertEqual(Attendance.objects.count(), 2)
+
+    @mock.patch("server_app.codes.generate", return_value="ABC123")
+    def test_committed_code_is_reused(self, generate):
+        Attendance.objects.filter(pk=self.attendance.pk).update(commit=True)
+
+        attendance = codes.save_with_code(Attendance(course=self.course, lat=1, long=2))
+
+        self.assertEqual(attendance.code, "ABC123")
+        self.assertEqual(generate.call_count, 1)
+
+
+class DeduplicateMigrationTest(TransactionTestCase):
+    """0006 merges the duplicates 0007's constraints would reject."""
+
+    before = [('server_app', '0005_xsession_indexes')]
+    after = [('server_app', '0007_attendance_constraints')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.apps = executor.loader.project_state(self.before).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+        return executor.loader.project_state(self.after).apps
+
+    def test_merges_duplicates(self):
+        User = self.apps.get_model('auth', 'User')
+        Lecturer = self.apps.get_model('server_app', 'Lecturer')
+        Course = self.apps.get_model('server_app', 'Course')
+        Attendance = self.apps.get_model('server_app', 'Attendance')
+        Student = self.apps.get_model('server_app', 'Student')
+        StudentAttendance = self.apps.get_model('server_app', 'StudentAttendance')
+
+        lecturer = Lecturer.objects.create(user=User.objects.create(username="lecturer@example.com"))
+        course = Course.objects.create(title="Course", code="CSC101", lecturer=lecturer)
+        older = Attendance.objects.create(course=course, code=" abc123", commit=False)
+        newer = Attendance.objects.create(course=course, code="ABC123", commit=False)
+        committed = Attendance.objects.create(course=course, code="ABC123", commit=True)
+
+        first = Student.objects.create(matric_number="M1", image="a.png")
+        enrolled = Student.objects.create(matric_number="M1", image="b.png", encoding=b"face")
+        StudentAttendance.objects.create(student=first, attendance=newer, commit=False)
+        StudentAttendance.objects.create(student=enrolled, attendance=newer, commit=True)
+        StudentAttendance.objects.create(student=first, attendance=committed, commit=True)
+
+        apps = self.migrate()
+        Attendance = apps.get_model('server_app', 'Attendance')
+        Student = apps.get_model('server_app', 'Student')
+        StudentAttendance = apps.get_model('server_app', 'StudentAttendance')
+
+        self.assertEqual(Attendance.objects.get(pk=newer.pk).code, "ABC123")
+        self.assertEqual(Attendance.objects.get(pk=committed.pk).code, "ABC123")
+        self.assertNotEqual(Attendance.objects.get(pk=older.pk).code, "ABC123")
+
+        self.assertEqual(list(Student.objects.values_list('pk', flat=True)), [enrolled.pk])
+
+        entries = StudentAttendance.objects.order_by('attendance_id')
+        self.assertEqual(
+            list(entries.values_list('student_id', 'attendance_id', 'commit')),
+            [(enrolled.pk, newer.pk, True), (enrolled.pk, committed.pk, True)])
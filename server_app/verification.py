@@ -0,0 +1,115 @@
+import logging
+
+from django.conf import settings
+
+from server_app import face_engine, face_index
+from server_app.models import Student
+
+logger = logging.getLogger(__name__)
+
+
+def reference_encoding(student):
+    encoding = student.face_encoding()
+
+    if encoding is None:
+        encoding = face_engine.encode(student.image.path)
+        if encoding is None:
+            return None
+        student.set_face_encoding(encoding)
+        student.save(update_fields=['encoding'])
+
+    return encoding
+
+
+def verify_face(student, file):
+    """Returns the rejection message, or None when the face matches the student."""
+    try:
+        analysis = face_engine.analyse(file)
+    except OSError:
+        return "Sorry your image could not be read, please capture it again"
+
+    message = check_face(student, analysis)
+
+    # logged with the sizes so FACE_IMAGE_MAX_DIMENSION can be tuned against rejections
+    logger.info(
+        "face check %s original=%sx%s processed=%sx%s faces=%d result=%s",
+        student.matric_number, *analysis.original_size, *analysis.size,
+        len(analysis.locations), message or "match")
+
+    return message
+
+
+def check_face(student, analysis):
+    face_location_list = analysis.locations
+    attendance_face_encoding = analysis.encoding
+
+    if len(face_location_list) > 1:
+        return f"Sorry {len(face_location_list)} faces were detected, only one face should be in the image"
+    if len(face_location_list) < 1:
+        return "Sorry no face was detected, make sure your face is showing in the image"
+
+    student_face_encoding = reference_encoding(student)
+    if student_face_encoding is None:
+        return "Sorry no face was found on your enrollment image, please enroll again"
+
+    if not face_engine.compare(student_face_encoding, attendance_face_encoding):
+        return "Sorry your face did not match with the one you submitted during enrollment"
+
+    return None
+
+
+def identify_tolerance():
+    return getattr(settings, "FACE_IDENTIFY_TOLERANCE", face_engine.TOLERANCE)
+
+
+def find_enrolled(encoding):
+    """Returns the enrolled student whose face is closest to the encoding, within tolerance."""
+    index = face_index.get_index()
+    student_id = index.match(encoding, identify_tolerance())
+    if student_id is None:
+        return None
+
+    student = Student.objects.filter(pk=student_id).first()
+    if student is None:
+        # deleted by another process since it was indexed
+        index.remove(student_id)
+    return student
+
+
+def match_faces(encodings):
+    """Matches a batch of encodings against every enrolled face in one pass.
+
+    Returns (student id or None, distance) per encoding.
+    """
+    if len(encodings) == 0:
+        return []
+
+    tolerance = identify_tolerance()
+    return [
+        (student_id if distance <= tolerance else None, distance)
+        for student_id, distance in face_index.get_index().search(encodings)
+    ]
+
+
+def identify_face(file):
+    """Returns (student, None) for the enrolled student in the image, or (None, rejection message)."""
+    try:
+        analysis = face_engine.analyse(file)
+    except OSError:
+        return None, "Sorry your image could not be read, please capture it again"
+
+    face_location_list = analysis.locations
+    if len(face_location_list) > 1:
+        return None, f"Sorry {len(face_location_list)} faces were detected, only one face should be in the image"
+    if len(face_location_list) < 1:
+        return None, "Sorry no face was detected, make sure your face is showing in the image"
+
+    student = find_enrolled(analysis.encoding)
+
+    logger.info(
+        "face identify original=%sx%s processed=%sx%s result=%s",
+        *analysis.original_size, *analysis.size, student or "no match")
+
+    if student is None:
+        return None, "Sorry your face did not match any enrolled student"
+    return student, None
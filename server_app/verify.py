@@ -1,46 +1,219 @@
+import datetime
+import threading
+import time
+from collections import OrderedDict
+
 from rest_framework.authentication import BaseAuthentication
 from django.middleware.csrf import CsrfViewMiddleware
 from rest_framework import exceptions
 from django.conf import settings
-from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 
-from server_app.models import UserType, XSession
+from server_app import codes
+from server_app.models import Lecturer, UserType, XSession
 
 # class CSRFCheck(CsrfViewMiddleware):
 #     def _reject(self, request, reason):
 #         return reason
 
-class JWTAuthentication(BaseAuthentication):
-    def authenticate(self, request):
-        User = get_user_model()
 
+class Principal:
+    """Who is making the request: the user, their UserType and, for a
+    lecturer, their Lecturer row. Set as request.auth by JWTAuthentication."""
 
-        
-        authorization_header = request.headers.get("Authorization")
-        
-        if not authorization_header:
-            return None
-        
+    def __init__(self, user, user_type, lecturer=None):
+        self.user = user
+        self.user_type = user_type
+        self.lecturer = lecturer
+
+    @property
+    def role(self):
+        return self.user_type.user_type if self.user_type else None
+
+    def is_lecturer(self):
+        return self.role == "LECTURER" and self.lecturer is not None
+
+
+def with_lecturer(queryset, user_field):
+    lecturers = Lecturer.objects.filter(user=OuterRef(user_field)).order_by('pk')
+    return queryset.annotate(
+        lecturer_id=Subquery(lecturers.values('pk')[:1]),
+        lecturer_email=Subquery(lecturers.values('email')[:1]))
+
+
+def make_principal(user_type, row):
+    lecturer = None
+    if row.lecturer_id is not None:
+        lecturer = Lecturer(pk=row.lecturer_id, user=user_type.user, email=row.lecturer_email)
+    return Principal(user_type.user, user_type, lecturer)
+
+
+def principal(request):
+    """The request's Principal, resolved with one query when the request was
+    not authenticated by JWTAuthentication."""
+    auth = getattr(request, "auth", None)
+    if isinstance(auth, Principal):
+        return auth
+
+    user = request.user
+    if not user or not user.is_authenticated:
+        return None
+
+    user_type = with_lecturer(
+        UserType.objects.select_related('user').filter(user=user), 'user').order_by('pk').first()
+    if user_type is None:
+        return Principal(user, None)
+    return make_principal(user_type, user_type)
+
+
+def session_expiry():
+    return timezone.now() + datetime.timedelta(days=getattr(settings, "SESSION_DAYS", 7))
+
+
+def max_sessions():
+    return getattr(settings, "SESSION_MAX_PER_USER", 10)
+
+
+def start_session(user_type):
+    """Creates a login session, dropping the user's expired sessions and
+    the oldest live ones past SESSION_MAX_PER_USER."""
+    for attempt in range(5):
         try:
-            authorization=authorization_header.split(" ")
+            with transaction.atomic():
+                session = XSession.objects.create(
+                    user_type=user_type, session=codes.generate(12), expires=session_expiry())
+            break
+        except IntegrityError:
+            # token collision with an existing session
+            if attempt == 4:
+                raise
+
+    user_sessions = XSession.objects.filter(user_type__user_id=user_type.user_id)
+    keep = list(user_sessions.filter(expires__gt=timezone.now()).order_by(
+        '-expires').values_list('pk', flat=True)[:max(max_sessions(), 1)])
+    # delete() sends post_delete, which drops them from the session cache
+    user_sessions.exclude(pk__in=keep).delete()
+
+    return session
+
+
+def cache_size():
+    return getattr(settings, "SESSION_CACHE_SIZE", 4096)
+
+
+def cache_ttl():
+    return getattr(settings, "SESSION_CACHE_TTL", 60)
+
+
+class SessionCache:
+    """Resolved sessions kept in memory, least recently used evicted first.
 
-            # if str.upper(authorization[0]) == 'ACCESS':
-            #     user = User.objects.get(username='admin')
-            #     return (user, None)
+    An entry lives for at most SESSION_CACHE_TTL seconds and never past the
+    session's own expiry, so a session deleted by another process stops
+    working here within the TTL. Logout in this process forgets it at once.
+    """
 
-            session_id = authorization[1]
-            session = XSession.objects.get(session = session_id)
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
 
-        except XSession.DoesNotExist:
-            raise exceptions.AuthenticationFailed("Token does not exist")
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
 
-        user = session.user_type.user
+            principal, expires, cached_until = entry
+            if cached_until < time.monotonic() or expires <= timezone.now():
+                del self._entries[token]
+                return None
 
-        if user is None:
-            raise exceptions.AuthenticationFailed("User not found")
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token, principal, expires):
+        size = cache_size()
+        if size <= 0:
+            return
+
+        with self._lock:
+            self._entries[token] = (principal, expires, time.monotonic() + cache_ttl())
+            self._entries.move_to_end(token)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def forget(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def forget_user(self, user_id):
+        with self._lock:
+            for token in [token for token, (principal, _, _) in self._entries.items()
+                          if principal.user.pk == user_id]:
+                del self._entries[token]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+sessions = SessionCache()
+
+
+def session_token(request):
+    authorization_header = request.headers.get("Authorization")
+
+    if not authorization_header:
+        return None
+
+    authorization = authorization_header.split(" ")
+    if len(authorization) < 2 or not authorization[1]:
+        raise exceptions.AuthenticationFailed("Token does not exist")
+
+    return authorization[1]
+
+
+def resolve_token(session_id):
+    """The Principal of a login token, from the session cache when it can.
+    Raises AuthenticationFailed for an unknown, expired or inactive one."""
+    cached = sessions.get(session_id)
+    if cached is not None:
+        return cached
+
+    try:
+        session = with_lecturer(
+            XSession.objects.select_related('user_type__user'), 'user_type__user'
+        ).get(session=session_id)
+    except XSession.DoesNotExist:
+        raise exceptions.AuthenticationFailed("Token does not exist")
+
+    if session.expires <= timezone.now():
+        session.delete()
+        raise exceptions.AuthenticationFailed("Token has expired, please login again")
+
+    user = session.user_type.user
+
+    if user is None:
+        raise exceptions.AuthenticationFailed("User not found")
+
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed("User is not active")
+
+    resolved = make_principal(session.user_type, session)
+    sessions.put(session_id, resolved, session.expires)
+
+    return resolved
+
+
+class JWTAuthentication(BaseAuthentication):
+    def authenticate(self, request):
+        session_id = session_token(request)
+
+        if session_id is None:
+            return None
 
-        
-        if not user.is_active:
-            raise exceptions.AuthenticationFailed("User is not active")
+        resolved = resolve_token(session_id)
 
-        return (user, None)
\ No newline at end of file
+        return (resolved.user, resolved)